@@ -87,10 +87,10 @@ async def test_streaming_asr(result: TestResult):
         await asr.add_audio_chunk(test_audio)
         
         # 验证音频已添加
-        if asr.audio_queue.qsize() > 0:
+        if asr.get_stats()["buffered_bytes"] > 0:
             result.pass_(test_name)
         else:
-            result.fail(test_name, "音频未添加到队列")
+            result.fail(test_name, "音频未添加到缓冲区")
     
     except Exception as e:
         result.fail(test_name, str(e))
@@ -11,6 +11,7 @@ from datetime import datetime
 from dataclasses import dataclass
 import json
 import os
+from contextlib import asynccontextmanager
 
 from coze_coding_dev_sdk import EmbeddingClient
 from langchain.tools import tool, ToolRuntime
@@ -26,7 +27,7 @@ class Document:
     doc_id: str
     content: str
     metadata: Dict[str, Any]
-    embedding: Optional[List[float]] = None
+    embedding: Optional[np.ndarray] = None  # int8量化向量
     created_at: datetime = None
 
 
@@ -41,6 +42,9 @@ class VectorDatabase:
     - ChromaDB
     """
     
+    # 批量添加时同时进行的嵌入请求数上限
+    EMBED_CONCURRENCY = 8
+    
     def __init__(self, embedding_dimensions: int = 1024):
         """
         参数:
@@ -49,8 +53,13 @@ class VectorDatabase:
         self.embedding_dimensions = embedding_dimensions
         self.documents: Dict[str, Document] = {}
         self.embeddings_matrix = None
+        self.embedding_norms = None
         self.doc_ids = []
         
+        # 批量导入模式嵌套深度；该模式下嵌入矩阵延迟到退出时重建
+        self._bulk_depth = 0
+        self._matrix_dirty = False
+        
         # 嵌入客户端
         self.embedding_client = EmbeddingClient()
     
@@ -83,7 +92,7 @@ class VectorDatabase:
                 doc_id=doc_id,
                 content=content,
                 metadata=metadata or {},
-                embedding=embedding,
+                embedding=self._quantize(embedding),
                 created_at=datetime.now()
             )
             
@@ -92,7 +101,7 @@ class VectorDatabase:
             self.doc_ids.append(doc_id)
             
             # 更新嵌入矩阵
-            self._update_embeddings_matrix()
+            self._mark_changed()
             
             logger.info(f"✅ 添加文档: {doc_id}")
             
@@ -115,16 +124,92 @@ class VectorDatabase:
         返回:
             成功添加的数量
         """
+        if not documents:
+            return 0
+        
+        doc_ids, contents, metadatas = zip(*documents)
+        return await self.add_knowledge_bulk(list(doc_ids), list(contents), list(metadatas))
+    
+    async def add_knowledge_bulk(
+        self,
+        doc_ids: List[str],
+        contents: List[str],
+        metadatas: List[Dict[str, Any]] = None
+    ) -> int:
+        """
+        批量添加文档（全部写入后只重建一次嵌入矩阵）
+        
+        参数:
+            doc_ids: 文档ID列表
+            contents: 文档内容列表
+            metadatas: 元数据列表
+        
+        返回:
+            成功添加的数量
+        """
+        if metadatas is None:
+            metadatas = [None] * len(doc_ids)
+        
+        # 相同内容只生成并量化一次嵌入，再按下标分发回每个文档（共享同一数组）
+        unique: Dict[str, int] = {}
+        index_of = [unique.setdefault(content, len(unique)) for content in contents]
+        unique_embeddings = [
+            embedding if isinstance(embedding, Exception) else self._quantize(embedding)
+            for embedding in await self._embed_texts(list(unique))
+        ]
+        embeddings = [unique_embeddings[i] for i in index_of]
+        
         success_count = 0
+        created_at = datetime.now()
         
-        for doc_id, content, metadata in documents:
-            if await self.add_document(doc_id, content, metadata):
-                success_count += 1
+        for doc_id, content, metadata, embedding in zip(doc_ids, contents, metadatas, embeddings):
+            if isinstance(embedding, Exception):
+                logger.error(f"❌ 添加文档失败: {doc_id}, 错误: {str(embedding)}")
+                continue
+            
+            if doc_id not in self.documents:
+                self.doc_ids.append(doc_id)
+            self.documents[doc_id] = Document(
+                doc_id=doc_id,
+                content=content,
+                metadata=metadata or {},
+                embedding=embedding,
+                created_at=created_at
+            )
+            success_count += 1
         
-        logger.info(f"✅ 批量添加文档: {success_count}/{len(documents)}")
+        if success_count:
+            self._mark_changed()
+        
+        logger.info(f"✅ 批量添加文档: {success_count}/{len(doc_ids)}")
         
         return success_count
     
+    async def _embed_texts(self, contents: List[str]) -> List[Any]:
+        """
+        并发生成多条文本的嵌入
+        
+        嵌入客户端为同步接口，且多条文本一次请求只返回一个融合向量，
+        因此逐条请求，放到线程池中并发执行，不阻塞事件循环
+        
+        返回:
+            与 contents 一一对应的嵌入列表，失败的条目为异常对象
+        """
+        semaphore = asyncio.Semaphore(self.EMBED_CONCURRENCY)
+        
+        async def embed_one(content: str) -> List[float]:
+            async with semaphore:
+                return await asyncio.to_thread(
+                    self.embedding_client.embed_text,
+                    content,
+                    dimensions=self.embedding_dimensions
+                )
+        
+        return await asyncio.gather(
+            *(embed_one(content) for content in contents),
+            return_exceptions=True
+        )
+    
     async def search(
         self,
         query: str,
@@ -149,13 +234,18 @@ class VectorDatabase:
                 dimensions=self.embedding_dimensions
             )
             
+            # 批量导入期间有未重建的变更时先重建，保证矩阵与 doc_ids 对应
+            if self._matrix_dirty:
+                self._matrix_dirty = False
+                self._update_embeddings_matrix()
+            
             # 计算相似度
             if self.embeddings_matrix is None or len(self.doc_ids) == 0:
                 return []
             
-            query_vec = np.array(query_embedding)
+            query_vec = np.asarray(query_embedding, dtype=np.float32)
             similarities = np.dot(self.embeddings_matrix, query_vec) / (
-                np.linalg.norm(self.embeddings_matrix, axis=1) * np.linalg.norm(query_vec)
+                self.embedding_norms * np.linalg.norm(query_vec)
             )
             
             # 获取top-k
@@ -174,18 +264,58 @@ class VectorDatabase:
             logger.error(f"❌ 搜索失败: {str(e)}")
             return []
     
+    @asynccontextmanager
+    async def bulk_import(self):
+        """
+        批量导入模式
+        
+        期间写入的文档不立即重建嵌入矩阵，退出时统一重建一次
+        """
+        self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            self._bulk_depth -= 1
+            if self._bulk_depth == 0 and self._matrix_dirty:
+                self._matrix_dirty = False
+                self._update_embeddings_matrix()
+    
+    def _mark_changed(self):
+        """文档变化后更新嵌入矩阵（批量导入模式下只做标记）"""
+        if self._bulk_depth:
+            self._matrix_dirty = True
+        else:
+            self._update_embeddings_matrix()
+    
+    @staticmethod
+    def _quantize(embedding: List[float]) -> np.ndarray:
+        """
+        按向量对称量化为int8
+        
+        余弦相似度与向量缩放无关，每个向量按自身最大绝对值缩放即可，
+        内存占用为float64列表的1/8
+        """
+        vec = np.asarray(embedding, dtype=np.float32)
+        scale = float(np.abs(vec).max()) if vec.size else 0.0
+        if scale == 0.0:
+            return np.zeros(vec.shape, dtype=np.int8)
+        return np.round(vec * (127.0 / scale)).astype(np.int8)
+    
     def _update_embeddings_matrix(self):
         """更新嵌入矩阵"""
         if len(self.doc_ids) == 0:
             self.embeddings_matrix = None
+            self.embedding_norms = None
             return
         
-        embeddings = [
+        embeddings = np.stack([
             self.documents[doc_id].embedding
             for doc_id in self.doc_ids
-        ]
+        ])
         
-        self.embeddings_matrix = np.array(embeddings)
+        # 检索时以float32参与计算，行范数预先算好
+        self.embeddings_matrix = embeddings.astype(np.float32)
+        self.embedding_norms = np.linalg.norm(self.embeddings_matrix, axis=1)
     
     def get_document(self, doc_id: str) -> Optional[Document]:
         """获取文档"""
@@ -196,7 +326,7 @@ class VectorDatabase:
         if doc_id in self.documents:
             del self.documents[doc_id]
             self.doc_ids.remove(doc_id)
-            self._update_embeddings_matrix()
+            self._mark_changed()
             return True
         return False
     
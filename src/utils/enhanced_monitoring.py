@@ -4,33 +4,54 @@
 """
 
 import asyncio
+import gzip
 import logging
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, Any, List
-from datetime import datetime, timedelta
-from collections import deque
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from datetime import datetime
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 import uvicorn
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .websocket_monitor import websocket_pool
+from .error_handler import error_handler
+from .monitoring_common import RingBuffer, json_dumps, json_response
+
 logger = logging.getLogger(__name__)
 
 
 class EnhancedPerformanceMetrics:
     """增强版性能指标收集器"""
     
+    __slots__ = (
+        "max_history",
+        "start_time",
+        "time_series",
+        "current",
+        "stats",
+        "_cache",
+        "_cache_sampled_total",
+        "window_stats"
+    )
+    
     def __init__(self, max_history: int = 1000):
         self.max_history = max_history
-        self.metrics_history = deque(maxlen=max_history)
         self.start_time = time.time()
         
-        # 时间序列数据（用于图表）
+        # 时间序列数据（用于图表和指标历史，其他指标在首次记录时创建）
         self.time_series = {
-            "danmaku_rate": deque(maxlen=100),
-            "response_time": deque(maxlen=100),
-            "cache_hit_rate": deque(maxlen=100),
-            "error_rate": deque(maxlen=100),
-            "websocket_latency": deque(maxlen=100)
+            "danmaku_rate": RingBuffer(max_history),
+            "response_time": RingBuffer(max_history),
+            "cache_hit_rate": RingBuffer(max_history),
+            "error_rate": RingBuffer(max_history),
+            "websocket_latency": RingBuffer(max_history)
         }
         
         # 当前指标
@@ -55,14 +76,16 @@ class EnhancedPerformanceMetrics:
         self.stats = {
             "total_danmaku_processed": 0,
             "total_errors": 0,
-            "cache_hits": 0,
-            "cache_misses": 0,
             "avg_response_time_sum": 0.0,
             "response_count": 0,
             "takeovers": 0,
             "audits": 0
         }
         
+        # 缓存计数 [未命中, 命中]，以 int(hit) 为下标
+        self._cache = [0, 0]
+        self._cache_sampled_total = 0
+        
         # 时间窗口统计
         self.window_stats = {
             "1min": {"danmaku": 0, "errors": 0},
@@ -74,20 +97,11 @@ class EnhancedPerformanceMetrics:
         """记录指标"""
         self.current[metric_name] = value
         
-        # 记录到历史
-        timestamp = datetime.now()
-        self.metrics_history.append({
-            "timestamp": timestamp.isoformat(),
-            "metric": metric_name,
-            "value": value
-        })
-        
-        # 记录到时间序列
-        if metric_name in self.time_series:
-            self.time_series[metric_name].append({
-                "timestamp": timestamp.isoformat(),
-                "value": value
-            })
+        # 记录到时间序列（同时作为指标历史）
+        buffer = self.time_series.get(metric_name)
+        if buffer is None:
+            buffer = self.time_series[metric_name] = RingBuffer(self.max_history)
+        buffer.push(time.time(), value)
     
     def record_danmaku(self, response_time: float):
         """记录弹幕处理"""
@@ -101,27 +115,27 @@ class EnhancedPerformanceMetrics:
         )
         
         # 更新时间序列
-        self.time_series["response_time"].append({
-            "timestamp": datetime.now().isoformat(),
-            "value": response_time
-        })
+        self.time_series["response_time"].push(time.time(), response_time)
     
     def record_cache_hit(self, hit: bool):
-        """记录缓存命中"""
-        if hit:
-            self.stats["cache_hits"] += 1
-        else:
-            self.stats["cache_misses"] += 1
-        
-        total = self.stats["cache_hits"] + self.stats["cache_misses"]
+        """记录缓存命中（仅计数，命中率在读取/采样时计算）"""
+        self._cache[hit] += 1
+    
+    def _update_cache_hit_rate(self) -> float:
+        """根据计数重新计算缓存命中率"""
+        misses, hits = self._cache
+        total = hits + misses
         if total > 0:
-            self.current["cache_hit_rate"] = self.stats["cache_hits"] / total
-            
-            # 更新时间序列
-            self.time_series["cache_hit_rate"].append({
-                "timestamp": datetime.now().isoformat(),
-                "value": self.current["cache_hit_rate"]
-            })
+            self.current["cache_hit_rate"] = hits / total
+        return self.current["cache_hit_rate"]
+    
+    def sample_cache_hit_rate(self):
+        """采样缓存命中率到时间序列（由后台快照任务定时调用）"""
+        total = self._cache[0] + self._cache[1]
+        if total == self._cache_sampled_total:
+            return
+        self._cache_sampled_total = total
+        self.time_series["cache_hit_rate"].push(time.time(), self._update_cache_hit_rate())
     
     def record_error(self):
         """记录错误"""
@@ -129,10 +143,9 @@ class EnhancedPerformanceMetrics:
         self.current["total_errors"] = self.stats["total_errors"]
         
         # 更新时间序列
-        self.time_series["error_rate"].append({
-            "timestamp": datetime.now().isoformat(),
-            "value": self.stats["total_errors"]
-        })
+        self.time_series["error_rate"].push(
+            time.time(), self.stats["total_errors"]
+        )
     
     def record_tts_output(self):
         """记录TTS输出"""
@@ -147,36 +160,62 @@ class EnhancedPerformanceMetrics:
         self.current["visual_analyses"] += 1
     
     def get_current_metrics(self) -> Dict[str, Any]:
-        """获取当前指标"""
-        return {
-            **self.current,
-            "uptime": time.time() - self.start_time,
-            "timestamp": datetime.now().isoformat()
-        }
+        """获取当前指标（原地更新易变字段并返回内部字典，调用方不应修改）"""
+        self._update_cache_hit_rate()
+        current = self.current
+        current["uptime"] = time.time() - self.start_time
+        current["timestamp"] = datetime.now().isoformat()
+        return current
     
     def get_stats(self) -> Dict[str, Any]:
-        """获取统计数据"""
-        return {
-            **self.stats,
-            "uptime": time.time() - self.start_time,
-            "cache_hit_rate": self.current["cache_hit_rate"],
-            "avg_response_time": self.current["avg_response_time"]
-        }
+        """获取统计数据（原地更新派生字段并返回内部字典，调用方不应修改）"""
+        stats = self.stats
+        stats["cache_hits"] = self._cache[1]
+        stats["cache_misses"] = self._cache[0]
+        stats["uptime"] = time.time() - self.start_time
+        stats["cache_hit_rate"] = self._update_cache_hit_rate()
+        stats["avg_response_time"] = self.current["avg_response_time"]
+        return stats
     
-    def get_time_series(self, metric_name: str = None) -> Dict[str, List]:
+    @staticmethod
+    def series_payload(buffer: RingBuffer) -> Dict[str, np.ndarray]:
+        """将环形缓冲区转换为列式响应格式（ts 为 Unix 时间戳）"""
+        ts, val = buffer.ordered()
+        return {"ts": ts, "val": val}
+    
+    def get_time_series(self, metric_name: str = None) -> Dict[str, Any]:
         """获取时间序列数据"""
         if metric_name:
             if metric_name in self.time_series:
                 return {
                     "metric": metric_name,
-                    "data": list(self.time_series[metric_name])
+                    **self.series_payload(self.time_series[metric_name])
                 }
             return {}
         
         # 返回所有时间序列
         return {
-            name: list(data)
-            for name, data in self.time_series.items()
+            name: self.series_payload(buffer)
+            for name, buffer in self.time_series.items()
+        }
+    
+    def get_summary(self, metric_name: str) -> Dict[str, Any]:
+        """获取时间序列的汇总统计（分位数/最大值/均值）"""
+        buffer = self.time_series.get(metric_name)
+        if buffer is None or len(buffer) == 0:
+            return {}
+        
+        values = buffer.val[:buffer.count]
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "metric": metric_name,
+            "count": buffer.count,
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean())
         }
     
     def get_metrics_history(
@@ -185,12 +224,19 @@ class EnhancedPerformanceMetrics:
         minutes: int = 10
     ) -> List[Dict[str, Any]]:
         """获取指标历史"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
+        buffer = self.time_series.get(metric_name)
+        if buffer is None:
+            return []
+        
+        ts, val = buffer.since(time.time() - minutes * 60)
         
         return [
-            m for m in self.metrics_history
-            if m["metric"] == metric_name
-            and datetime.fromisoformat(m["timestamp"]) >= cutoff
+            {
+                "timestamp": datetime.fromtimestamp(t).isoformat(),
+                "metric": metric_name,
+                "value": v
+            }
+            for t, v in zip(ts.tolist(), val.tolist())
         ]
 
 
@@ -201,40 +247,149 @@ enhanced_performance_metrics = EnhancedPerformanceMetrics()
 class EnhancedMonitoringAPI:
     """增强版监控API"""
     
+    # 快照刷新间隔（秒），所有轮询请求共享同一份序列化结果
+    SNAPSHOT_INTERVAL = 0.5
+    
     def __init__(self):
-        self.app = FastAPI(title="Live AI Assistant - Enhanced Monitoring API")
+        self._cached_metrics_bytes = b"{}"
+        self._cached_stats_bytes = b"{}"
+        self._cached_health_bytes = b"{}"
+        self._snapshot_task = None
+        
+        # 仪表板HTML为静态内容，启动时预压缩一次
+        self._dashboard_html = self._generate_enhanced_dashboard_html().encode("utf-8")
+        self._dashboard_gzip = gzip.compress(self._dashboard_html, 9)
+        self._dashboard_br = (
+            brotli.compress(self._dashboard_html, quality=11) if brotli else None
+        )
+        
+        # 人机协作模块为可选依赖，仅在初始化时导入一次
+        try:
+            from .human_collaboration import takeover_trigger, audit_queue
+            self._takeover_trigger = takeover_trigger
+            self._audit_queue = audit_queue
+        except ImportError:
+            self._takeover_trigger = None
+            self._audit_queue = None
+        
+        self.app = FastAPI(
+            title="Live AI Assistant - Enhanced Monitoring API",
+            lifespan=self._lifespan
+        )
         self._setup_routes()
     
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """启动/停止后台快照任务"""
+        self._refresh_snapshots()
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        try:
+            yield
+        finally:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+            
+            # 处理完剩余的告警/恢复任务，停止后台任务并关闭共享HTTP会话
+            await error_handler.close()
+    
+    async def _snapshot_loop(self):
+        """后台定时刷新指标快照"""
+        while True:
+            await asyncio.sleep(self.SNAPSHOT_INTERVAL)
+            try:
+                self._refresh_snapshots()
+            except Exception as e:
+                logger.error("刷新监控快照失败: %s", e)
+    
+    def _refresh_snapshots(self):
+        """计算并预序列化指标、统计和健康状态"""
+        enhanced_performance_metrics.sample_cache_hit_rate()
+        self._cached_metrics_bytes = json_dumps(enhanced_performance_metrics.get_current_metrics())
+        self._cached_stats_bytes = json_dumps(enhanced_performance_metrics.get_stats())
+        self._cached_health_bytes = json_dumps(self._build_health())
+    
+    def _build_health(self) -> Dict[str, Any]:
+        """构建健康检查数据"""
+        pool_stats = websocket_pool.get_all_stats()
+        error_stats = error_handler.get_error_stats()
+        
+        health_status = "healthy"
+        if pool_stats["failed"] > 0:
+            health_status = "degraded"
+        if pool_stats["failed"] > 2 or error_stats["unresolved_errors"] > 5:
+            health_status = "unhealthy"
+        
+        return {
+            "status": health_status,
+            "websocket": pool_stats,
+            "errors": error_stats,
+            "timestamp": datetime.now().isoformat()
+        }
+    
     def _setup_routes(self):
         """设置路由"""
         
         @self.app.get("/")
-        async def dashboard():
+        async def dashboard(request: Request):
             """监控仪表板"""
-            html_content = self._generate_enhanced_dashboard_html()
-            return HTMLResponse(content=html_content)
+            accept_encoding = request.headers.get("accept-encoding", "")
+            if self._dashboard_br is not None and "br" in accept_encoding:
+                content, encoding = self._dashboard_br, "br"
+            elif "gzip" in accept_encoding:
+                content, encoding = self._dashboard_gzip, "gzip"
+            else:
+                content, encoding = self._dashboard_html, None
+            
+            headers = {"Vary": "Accept-Encoding"}
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            return HTMLResponse(content=content, headers=headers)
         
         @self.app.get("/api/metrics")
         async def get_metrics():
             """获取当前指标"""
-            return JSONResponse(content=enhanced_performance_metrics.get_current_metrics())
+            return Response(self._cached_metrics_bytes, media_type="application/json")
         
         @self.app.get("/api/stats")
         async def get_stats():
             """获取统计数据"""
-            return JSONResponse(content=enhanced_performance_metrics.get_stats())
+            return Response(self._cached_stats_bytes, media_type="application/json")
         
         @self.app.get("/api/timeseries/{metric_name}")
         async def get_time_series(metric_name: str):
             """获取时间序列数据"""
             data = enhanced_performance_metrics.get_time_series(metric_name)
-            return JSONResponse(content=data)
+            return json_response(data)
         
         @self.app.get("/api/timeseries")
         async def get_all_time_series():
-            """获取所有时间序列数据"""
-            data = enhanced_performance_metrics.get_time_series()
-            return JSONResponse(content=data)
+            """获取所有时间序列数据（逐个序列流式输出，峰值内存只占单个序列）"""
+            # 先取序列列表快照：输出过程中 record_metric 可能新增序列
+            series = list(enhanced_performance_metrics.time_series.items())
+            
+            async def generate():
+                yield b"{"
+                first = True
+                for name, buffer in series:
+                    if not first:
+                        yield b","
+                    first = False
+                    yield (
+                        json_dumps(name) + b":"
+                        + json_dumps(enhanced_performance_metrics.series_payload(buffer))
+                    )
+                yield b"}"
+            
+            return StreamingResponse(generate(), media_type="application/json")
+        
+        @self.app.get("/api/summary/{metric_name}")
+        async def get_summary(metric_name: str):
+            """获取时间序列汇总统计"""
+            return json_response(enhanced_performance_metrics.get_summary(metric_name))
         
         @self.app.get("/api/history/{metric_name}")
         async def get_metric_history(metric_name: str, minutes: int = 10):
@@ -245,40 +400,21 @@ class EnhancedMonitoringAPI:
         @self.app.get("/api/health")
         async def health_check():
             """健康检查"""
-            from .websocket_monitor import websocket_pool
-            from .error_handler import error_handler
-            
-            pool_stats = websocket_pool.get_all_stats()
-            error_stats = error_handler.get_error_stats()
-            
-            health_status = "healthy"
-            if pool_stats["failed"] > 0:
-                health_status = "degraded"
-            if pool_stats["failed"] > 2 or error_stats["unresolved_errors"] > 5:
-                health_status = "unhealthy"
-            
-            return JSONResponse(content={
-                "status": health_status,
-                "websocket": pool_stats,
-                "errors": error_stats,
-                "timestamp": datetime.now().isoformat()
-            })
+            return Response(self._cached_health_bytes, media_type="application/json")
         
         @self.app.get("/api/collaboration")
         async def get_collaboration_stats():
             """获取人机协作统计"""
-            try:
-                from .human_collaboration import takeover_trigger, audit_queue
-                
-                return JSONResponse(content={
-                    "takeover": takeover_trigger.get_statistics(),
-                    "audit": audit_queue.get_statistics()
-                })
-            except ImportError:
+            if self._takeover_trigger is None or self._audit_queue is None:
                 return JSONResponse(content={
                     "takeover": {},
                     "audit": {}
                 })
+            
+            return JSONResponse(content={
+                "takeover": self._takeover_trigger.get_statistics(),
+                "audit": self._audit_queue.get_statistics()
+            })
     
     def _generate_enhanced_dashboard_html(self) -> str:
         """生成增强版仪表板HTML"""
@@ -791,8 +927,18 @@ class EnhancedMonitoringAPI:
     
     def run(self, host: str = "0.0.0.0", port: int = 8000):
         """启动监控服务"""
-        logger.info(f"🚀 启动增强版监控API服务: http://{host}:{port}")
-        uvicorn.run(self.app, host=host, port=port)
+        logger.info("🚀 启动增强版监控API服务: http://%s:%d", host, port)
+        # loop/http 为 auto 时会优先选用 uvloop/httptools（已在依赖中声明）；
+        # 指标保存在进程内存中，因此保持单 worker，避免多进程数据不一致
+        uvicorn.run(
+            self.app,
+            host=host,
+            port=port,
+            loop="auto",
+            http="auto",
+            log_level="warning",
+            access_log=False
+        )
 
 
 # 全局增强版监控API实例
@@ -5,13 +5,19 @@
 
 import logging
 import asyncio
+import functools
+import hashlib
+import re
+import sys
+import time
 import traceback
 from enum import Enum
-from typing import Optional, Callable, Dict, List, Any
+from typing import Optional, Callable, ClassVar, Dict, List, Any, Tuple
 from datetime import datetime
+from collections import deque
 from dataclasses import dataclass, field
 import os
-import requests
+import aiohttp
 
 logger = logging.getLogger(__name__)
 
@@ -36,18 +42,84 @@ class ErrorCategory(Enum):
     SYSTEM = "system"              # 系统相关
 
 
-@dataclass
+@dataclass(slots=True, init=False)
 class ErrorRecord:
-    """错误记录"""
+    """
+    错误记录
+    
+    stack_trace 和 resolved 为属性，仍可作为构造参数传入（参数顺序与原字段一致）；
+    exc_info 和 created_at_mono 只能以关键字传入
+    """
     level: ErrorLevel
     category: ErrorCategory
     message: str
     exception: Optional[Exception] = None
-    stack_trace: Optional[str] = None
+    exc_info: Optional[tuple] = field(default=None, repr=False)
     timestamp: datetime = field(default_factory=datetime.now)
+    created_at_mono: float = field(default_factory=time.monotonic, repr=False)
     context: Dict[str, Any] = field(default_factory=dict)
-    resolved: bool = False
     retry_count: int = 0
+    _stack_trace: Optional[str] = field(default=None, init=False, repr=False)
+    _resolved: bool = field(default=False, init=False)
+    # 记录处于最近错误窗口时，解决状态变化通过该回调通知 ErrorHandler 更新未解决计数
+    _resolved_listener: Optional[Callable[[bool], None]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    
+    def __init__(
+        self,
+        level: ErrorLevel,
+        category: ErrorCategory,
+        message: str,
+        exception: Optional[Exception] = None,
+        stack_trace: Optional[str] = None,
+        timestamp: Optional[datetime] = None,
+        context: Optional[Dict[str, Any]] = None,
+        resolved: bool = False,
+        retry_count: int = 0,
+        *,
+        exc_info: Optional[tuple] = None,
+        created_at_mono: Optional[float] = None
+    ):
+        self.level = level
+        self.category = category
+        self.message = message
+        self.exception = exception
+        self.exc_info = exc_info
+        self.timestamp = timestamp if timestamp is not None else datetime.now()
+        self.created_at_mono = created_at_mono if created_at_mono is not None else time.monotonic()
+        self.context = context if context is not None else {}
+        self.retry_count = retry_count
+        self._stack_trace = stack_trace
+        self._resolved = bool(resolved)
+        self._resolved_listener = None
+    
+    @property
+    def resolved(self) -> bool:
+        """是否已解决"""
+        return self._resolved
+    
+    @resolved.setter
+    def resolved(self, value: bool):
+        value = bool(value)
+        if value == self._resolved:
+            return
+        self._resolved = value
+        if self._resolved_listener is not None:
+            self._resolved_listener(value)
+    
+    @property
+    def stack_trace(self) -> Optional[str]:
+        """堆栈信息（首次访问时才格式化）"""
+        if self._stack_trace is None and self.exc_info is not None:
+            self._stack_trace = "".join(traceback.format_exception(*self.exc_info))
+        return self._stack_trace
+    
+    def release_exc_info(self):
+        """格式化堆栈后释放异常信息，不再持有traceback引用的栈帧及其局部变量"""
+        if self.exc_info is not None:
+            self._stack_trace = self.stack_trace
+            self.exc_info = None
 
 
 class ErrorClassifier:
@@ -81,35 +153,68 @@ class ErrorClassifier:
         ]
     }
     
+    # 所有模式编译为一个正则，分组名即类别名；使用零宽前瞻以便重叠的匹配也能被找到
+    _PATTERN_REGEX = re.compile(
+        "(?=" + "|".join(
+            f"(?P<{category.name}>{'|'.join(map(re.escape, patterns))})"
+            for category, patterns in ERROR_PATTERNS.items()
+        ) + ")",
+        re.IGNORECASE
+    )
+    
+    # 类别优先级（与 ERROR_PATTERNS 的声明顺序一致）
+    _CATEGORIES = tuple(ERROR_PATTERNS)
+    _CATEGORY_PRIORITY = {
+        category.name: index for index, category in enumerate(ERROR_PATTERNS)
+    }
+    
+    _CONNECTION_REGEX = re.compile("connection", re.IGNORECASE)
+    _DISCONNECTED_REGEX = re.compile("disconnected", re.IGNORECASE)
+    
+    # 参与缓存的错误信息/消息的最大长度，超长消息不缓存，避免撑大缓存
+    CACHE_KEY_MAX_LEN = 128
+    
     @classmethod
     def classify_error(cls, error: Exception, message: str) -> ErrorCategory:
         """分类错误"""
-        error_info = str(error).lower() + " " + message.lower()
-        
-        for category, patterns in cls.ERROR_PATTERNS.items():
-            if any(pattern in error_info for pattern in patterns):
-                return category
+        return cls._classify_text(str(error) + " " + message)
+    
+    @classmethod
+    def _classify_text(cls, error_info: str) -> ErrorCategory:
+        """按错误文本分类"""
+        # 单次扫描，取优先级最高的命中类别
+        best = None
+        for match in cls._PATTERN_REGEX.finditer(error_info):
+            priority = cls._CATEGORY_PRIORITY[match.lastgroup]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
         
-        return ErrorCategory.SYSTEM
+        if best is None:
+            return ErrorCategory.SYSTEM
+        return cls._CATEGORIES[best]
     
     @classmethod
     def determine_level(cls, error: Exception, category: ErrorCategory) -> ErrorLevel:
         """确定错误级别"""
-        # 根据异常类型和类别确定级别
-        error_type = type(error).__name__
-        
+        return cls._level_for(type(error).__name__, str(error), category)
+    
+    @classmethod
+    def _level_for(cls, error_type: str, error_str: str, category: ErrorCategory) -> ErrorLevel:
+        """根据异常类型名、错误信息和类别确定级别"""
         # 致命错误
         if error_type in ["MemoryError", "OSError", "SystemExit"]:
             return ErrorLevel.FATAL
         
-        if category == ErrorCategory.DATABASE and "connection" in str(error).lower():
+        if category == ErrorCategory.DATABASE and cls._CONNECTION_REGEX.search(error_str):
             return ErrorLevel.FATAL
         
         # 严重错误
         if category in [ErrorCategory.DATABASE, ErrorCategory.CACHE]:
             return ErrorLevel.ERROR
         
-        if category == ErrorCategory.WEBSOCKET and "disconnected" in str(error).lower():
+        if category == ErrorCategory.WEBSOCKET and cls._DISCONNECTED_REGEX.search(error_str):
             return ErrorLevel.ERROR
         
         # 警告
@@ -117,6 +222,49 @@ class ErrorClassifier:
             return ErrorLevel.WARN
         
         return ErrorLevel.INFO
+    
+    @classmethod
+    def classify(
+        cls,
+        error: Exception,
+        message: str,
+        error_str: Optional[str] = None
+    ) -> Tuple[ErrorCategory, ErrorLevel]:
+        """
+        分类错误并确定级别（信息不超过缓存长度上限时按异常类型和信息缓存结果）
+        
+        参数:
+            error: 异常对象
+            message: 错误消息
+            error_str: 已计算好的 str(error)，调用方复用时传入
+        
+        返回:
+            (错误类别, 错误级别)
+        """
+        if error_str is None:
+            error_str = str(error)
+        error_type = type(error).__name__
+        
+        # 超长信息不进缓存，按完整文本分类，避免截断后漏掉靠后的关键词
+        max_len = cls.CACHE_KEY_MAX_LEN
+        if len(error_str) > max_len or len(message) > max_len:
+            return _classify_uncached(error_type, error_str, message)
+        return _classify_cached(error_type, error_str, message)
+
+
+def _classify_uncached(
+    error_type: str,
+    error_str: str,
+    message: str
+) -> Tuple[ErrorCategory, ErrorLevel]:
+    """按异常类型名、错误信息和消息分类并确定级别"""
+    category = ErrorClassifier._classify_text(error_str + " " + message)
+    level = ErrorClassifier._level_for(error_type, error_str, category)
+    return category, level
+
+
+# 带LRU缓存的错误分类，重复出现的错误直接命中缓存
+_classify_cached = functools.lru_cache(maxsize=1024)(_classify_uncached)
 
 
 class AlertChannel(Enum):
@@ -130,10 +278,64 @@ class AlertChannel(Enum):
 class AlertManager:
     """告警管理器"""
     
+    # 错误级别对应的日志方法
+    _LOG_METHODS: ClassVar[Dict[ErrorLevel, Callable]] = {
+        ErrorLevel.FATAL: logger.critical,
+        ErrorLevel.ERROR: logger.error,
+        ErrorLevel.WARN: logger.warning,
+        ErrorLevel.INFO: logger.info
+    }
+    
+    # Webhook批量发送：窗口期内的告警合并为一次POST
+    WEBHOOK_BATCH_WINDOW = 0.05
+    WEBHOOK_BATCH_SIZE = 32
+    
     def __init__(self):
         self.webhook_url = os.getenv("MONITOR_WEBHOOK_URL", "")
         self.email = os.getenv("MONITOR_EMAIL", "")
         self.phone = os.getenv("MONITOR_PHONE", "")
+        
+        # 共享HTTP会话，避免每次告警重新建立连接
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # 待发送的Webhook告警及进行中的发送任务
+        self._webhook_buffer: List[Dict[str, Any]] = []
+        self._webhook_timer: Optional[asyncio.Task] = None
+        self._webhook_tasks: set = set()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享HTTP会话（首次使用时在当前事件循环中创建）"""
+        loop = asyncio.get_running_loop()
+        # 会话绑定创建时的事件循环；事件循环更换后（如多次 asyncio.run）重新创建
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def flush(self):
+        """立即发送缓冲中的Webhook告警，并等待所有发送任务完成"""
+        if self._webhook_timer is not None and not self._webhook_timer.done():
+            self._webhook_timer.cancel()
+        self._webhook_timer = None
+        self._dispatch_webhook_batch()
+        
+        if self._webhook_tasks:
+            await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+    
+    async def close(self):
+        """发送剩余告警并关闭共享HTTP会话"""
+        await self.flush()
+        if (
+            self._session is not None
+            and not self._session.closed
+            and self._session_loop is asyncio.get_running_loop()
+        ):
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
     
     async def send_alert(
         self,
@@ -156,36 +358,84 @@ class AlertManager:
             else:
                 channels = [AlertChannel.LOG]
         
+        # 日志告警同步执行，其余渠道并发发送，总耗时取决于最慢的渠道
+        async_channels = []
+        tasks = []
         for channel in channels:
-            try:
-                if channel == AlertChannel.WEBHOOK:
-                    await self._send_webhook_alert(error)
-                elif channel == AlertChannel.EMAIL:
-                    await self._send_email_alert(error)
-                elif channel == AlertChannel.SMS:
-                    await self._send_sms_alert(error)
-                elif channel == AlertChannel.LOG:
+            if channel == AlertChannel.LOG:
+                try:
                     self._send_log_alert(error)
-            except Exception as e:
-                logger.error(f"发送告警失败 [{channel}]: {str(e)}")
+                except Exception as e:
+                    logger.error(f"发送告警失败 [{channel}]: {str(e)}")
+                continue
+            
+            if channel == AlertChannel.WEBHOOK:
+                tasks.append(self._send_webhook_alert(error))
+            elif channel == AlertChannel.EMAIL:
+                tasks.append(self._send_email_alert(error))
+            elif channel == AlertChannel.SMS:
+                tasks.append(self._send_sms_alert(error))
+            else:
+                continue
+            async_channels.append(channel)
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for channel, result in zip(async_channels, results):
+            if isinstance(result, Exception):
+                logger.error(f"发送告警失败 [{channel}]: {str(result)}")
     
     async def _send_webhook_alert(self, error: ErrorRecord):
-        """发送Webhook告警"""
+        """
+        发送Webhook告警
+        
+        告警先进入缓冲区，窗口期结束或达到批量上限时合并发送
+        """
         if not self.webhook_url:
             return
         
-        payload = {
+        self._webhook_buffer.append({
             "level": error.level.name,
             "category": error.category.value,
             "message": error.message,
             "timestamp": error.timestamp.isoformat(),
             "context": error.context
-        }
+        })
+        
+        if len(self._webhook_buffer) >= self.WEBHOOK_BATCH_SIZE:
+            self._dispatch_webhook_batch()
+        elif self._webhook_timer is None or self._webhook_timer.done():
+            self._webhook_timer = asyncio.create_task(self._webhook_batch_timer())
+    
+    async def _webhook_batch_timer(self):
+        """等待批量窗口结束后发送缓冲中的告警"""
+        await asyncio.sleep(self.WEBHOOK_BATCH_WINDOW)
+        self._dispatch_webhook_batch()
+    
+    def _dispatch_webhook_batch(self):
+        """取出缓冲区中的告警，在后台任务中发送"""
+        if not self._webhook_buffer:
+            return
+        
+        batch, self._webhook_buffer = self._webhook_buffer, []
+        task = asyncio.create_task(self._post_webhook_batch(batch))
+        self._webhook_tasks.add(task)
+        task.add_done_callback(self._webhook_tasks.discard)
+    
+    async def _post_webhook_batch(self, batch: List[Dict[str, Any]]):
+        """发送一批Webhook告警（单条保持原格式，多条合并为 {"alerts": [...]}）"""
+        payload = batch[0] if len(batch) == 1 else {"alerts": batch}
         
-        response = requests.post(self.webhook_url, json=payload, timeout=10)
-        response.raise_for_status()
+        try:
+            async with self._get_session().post(self.webhook_url, json=payload) as response:
+                response.raise_for_status()
+        except Exception as e:
+            logger.error(f"发送告警失败 [{AlertChannel.WEBHOOK}]: {str(e)}")
+            return
         
-        logger.info(f"✅ Webhook告警已发送: {error.message[:50]}")
+        if len(batch) == 1:
+            logger.info(f"✅ Webhook告警已发送: {batch[0]['message'][:50]}")
+        else:
+            logger.info(f"✅ Webhook告警已批量发送: {len(batch)}条")
     
     async def _send_email_alert(self, error: ErrorRecord):
         """发送邮件告警"""
@@ -199,12 +449,7 @@ class AlertManager:
     
     def _send_log_alert(self, error: ErrorRecord):
         """记录日志告警"""
-        log_method = {
-            ErrorLevel.FATAL: logger.critical,
-            ErrorLevel.ERROR: logger.error,
-            ErrorLevel.WARN: logger.warning,
-            ErrorLevel.INFO: logger.info
-        }.get(error.level, logger.info)
+        log_method = self._LOG_METHODS.get(error.level, logger.info)
         
         log_method(
             f"[{error.level.name}] {error.category.value}: {error.message}\n"
@@ -301,12 +546,139 @@ class AutoRecovery:
 class ErrorHandler:
     """错误处理器 - 统一的错误处理入口"""
     
-    def __init__(self):
+    # 近期错误统计窗口（秒）
+    RECENT_WINDOW_SECONDS = 3600
+    
+    # 去重指纹表超过该大小时清理过期条目
+    DEDUPE_PRUNE_THRESHOLD = 1024
+    
+    def __init__(self, max_queue_size: int = 1000, dedupe_window: float = 60.0):
+        """
+        参数:
+            max_queue_size: 告警/恢复后台队列的最大长度，队列满时丢弃新任务
+            dedupe_window: 相同错误的告警去重窗口（秒），窗口内只告警一次
+        """
         self.classifier = ErrorClassifier()
         self.alert_manager = AlertManager()
         self.auto_recovery = AutoRecovery()
-        self.error_history: List[ErrorRecord] = []
+        self.error_history: deque = deque()
         self.error_counts: Dict[str, int] = {}
+        
+        # 最近1小时的错误（按时间顺序，读写时从队首淘汰过期记录）
+        self._recent_errors: deque = deque()
+        self._recent_unresolved = 0
+        
+        # 告警和自动恢复由后台任务处理，不阻塞调用方
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dropped = 0
+        
+        # 相同错误去重：指纹 -> 上次告警时间 / 期间被抑制的次数
+        self.dedupe_window = dedupe_window
+        self._last_alert_ts: Dict[bytes, float] = {}
+        self._suppressed_count: Dict[bytes, int] = {}
+    
+    @staticmethod
+    def _fingerprint(
+        error: Exception,
+        error_str: str,
+        message: str,
+        enable_alert: bool,
+        enable_recovery: bool
+    ) -> bytes:
+        """计算错误指纹（告警/恢复开关不同的调用分别去重，互不抑制）"""
+        key = (
+            f"{type(error).__name__}|{error_str[:200]}|{message[:200]}"
+            f"|{int(enable_alert)}{int(enable_recovery)}"
+        )
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    
+    def _should_dispatch(self, fingerprint: bytes) -> Tuple[bool, int]:
+        """
+        判断是否需要发送告警/尝试恢复
+        
+        返回:
+            (是否发送, 上次发送以来被抑制的次数)
+        """
+        now = time.monotonic()
+        last = self._last_alert_ts.get(fingerprint)
+        if last is not None and now - last < self.dedupe_window:
+            self._suppressed_count[fingerprint] = self._suppressed_count.get(fingerprint, 0) + 1
+            return False, 0
+        
+        if len(self._last_alert_ts) >= self.DEDUPE_PRUNE_THRESHOLD:
+            self._prune_fingerprints(now)
+        
+        self._last_alert_ts[fingerprint] = now
+        return True, self._suppressed_count.pop(fingerprint, 0)
+    
+    def _prune_fingerprints(self, now: float):
+        """清理超出去重窗口的指纹"""
+        expired = [
+            fp for fp, ts in self._last_alert_ts.items()
+            if now - ts >= self.dedupe_window
+        ]
+        for fp in expired:
+            del self._last_alert_ts[fp]
+            self._suppressed_count.pop(fp, None)
+    
+    def _ensure_worker(self):
+        """在当前事件循环中启动后台处理任务（首次使用或事件循环变化时）"""
+        if self._worker is not None and not self._worker.done():
+            if self._worker.get_loop() is asyncio.get_running_loop():
+                return
+        
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._consume())
+    
+    async def _consume(self):
+        """后台处理告警和自动恢复"""
+        while True:
+            error_record, enable_alert, enable_recovery = await self._queue.get()
+            try:
+                # 发送告警
+                if enable_alert:
+                    await self.alert_manager.send_alert(error_record)
+                
+                # 尝试自动恢复
+                if enable_recovery:
+                    recovery_success = await self.auto_recovery.attempt_recovery(error_record)
+                    if recovery_success:
+                        error_record.resolved = True
+            except Exception as e:
+                logger.error(f"❌ 错误后台处理失败: {str(e)}")
+            finally:
+                self._queue.task_done()
+    
+    def _worker_running(self) -> bool:
+        """后台处理任务是否在当前事件循环中运行"""
+        return (
+            self._worker is not None
+            and not self._worker.done()
+            and self._worker.get_loop() is asyncio.get_running_loop()
+        )
+    
+    async def flush(self):
+        """等待已提交的告警和恢复任务处理完成"""
+        if self._queue is not None and self._worker_running():
+            await self._queue.join()
+        await self.alert_manager.flush()
+    
+    async def close(self):
+        """处理完队列中剩余的告警和恢复任务，停止后台任务并关闭告警管理器"""
+        await self.flush()
+        
+        if self._worker_running():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+        
+        await self.alert_manager.close()
     
     async def handle_error(
         self,
@@ -329,51 +701,78 @@ class ErrorHandler:
         返回:
             错误记录
         """
-        # 分类错误
-        category = self.classifier.classify_error(error, message)
-        level = self.classifier.determine_level(error, category)
+        # 分类错误（str(error) 只计算一次，分类和去重指纹共用）
+        error_str = str(error)
+        category, level = self.classifier.classify(error, message, error_str)
         
-        # 创建错误记录
+        # 创建错误记录（只保存异常信息引用，堆栈在访问时才格式化）
+        exc_info = sys.exc_info()
         error_record = ErrorRecord(
             level=level,
             category=category,
             message=message,
             exception=error,
-            stack_trace=traceback.format_exc(),
+            exc_info=exc_info if exc_info[0] is not None else None,
             context=context or {}
         )
         
         # 记录错误历史
         self.error_history.append(error_record)
+        self._recent_errors.append(error_record)
+        self._recent_unresolved += 1
+        error_record._resolved_listener = self._on_resolved_change
+        self._prune_recent_errors()
         
         # 统计错误次数
         error_key = f"{category.value}:{level.name}"
         self.error_counts[error_key] = self.error_counts.get(error_key, 0) + 1
         
-        # 发送告警
-        if enable_alert:
-            await self.alert_manager.send_alert(error_record)
-        
-        # 尝试自动恢复
-        if enable_recovery:
-            recovery_success = await self.auto_recovery.attempt_recovery(error_record)
-            if recovery_success:
-                error_record.resolved = True
+        # 告警和自动恢复交给后台任务，立即返回；去重窗口内的相同错误只计数
+        if enable_alert or enable_recovery:
+            fingerprint = self._fingerprint(error, error_str, message, enable_alert, enable_recovery)
+            dispatch, suppressed = self._should_dispatch(fingerprint)
+            if not dispatch:
+                return error_record
+            if suppressed:
+                error_record.context = {
+                    **error_record.context,
+                    "suppressed_since_last": suppressed
+                }
+            
+            self._ensure_worker()
+            try:
+                self._queue.put_nowait((error_record, enable_alert, enable_recovery))
+            except asyncio.QueueFull:
+                self._dropped += 1
+                logger.warning(f"⚠️ 错误处理队列已满，丢弃告警/恢复任务: {message[:50]}")
         
         return error_record
     
+    def _prune_recent_errors(self):
+        """淘汰超过1小时的错误记录（同时释放其异常信息）"""
+        cutoff = time.monotonic() - self.RECENT_WINDOW_SECONDS
+        recent = self._recent_errors
+        while recent and recent[0].created_at_mono <= cutoff:
+            record = recent.popleft()
+            record._resolved_listener = None
+            record.release_exc_info()
+            if not record.resolved:
+                self._recent_unresolved -= 1
+    
+    def _on_resolved_change(self, resolved: bool):
+        """最近窗口内的错误记录解决状态变化时更新未解决计数"""
+        self._recent_unresolved += -1 if resolved else 1
+    
     def get_error_stats(self) -> Dict[str, Any]:
         """获取错误统计"""
-        recent_errors = [
-            e for e in self.error_history
-            if (datetime.now() - e.timestamp).total_seconds() < 3600  # 最近1小时
-        ]
+        self._prune_recent_errors()
         
         return {
             "total_errors": len(self.error_history),
-            "recent_errors": len(recent_errors),
+            "recent_errors": len(self._recent_errors),
             "error_counts": self.error_counts,
-            "unresolved_errors": len([e for e in recent_errors if not e.resolved])
+            "unresolved_errors": self._recent_unresolved,
+            "dropped_tasks": self._dropped
         }
 
 
@@ -4,13 +4,22 @@
 """
 
 import asyncio
+import heapq
 import logging
-from typing import Optional, Dict, Any, List
+import sys
+from typing import Optional, ClassVar, Dict, Any, List, Iterable, Set, Tuple
 from datetime import datetime
 from enum import Enum
 from dataclasses import dataclass, field
-from collections import deque
+from operator import attrgetter
+from collections import Counter, deque, OrderedDict
 import json
+import uuid
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +50,7 @@ class UrgencyLevel(Enum):
     CRITICAL = 4  # 严重：必须人工介入
 
 
-@dataclass
+@dataclass(slots=True)
 class TakeoverRequest:
     """人工接管请求"""
     request_id: str
@@ -57,9 +66,32 @@ class TakeoverRequest:
     status: str = "pending"
     assigned_to: Optional[str] = None
     resolved_at: Optional[datetime] = None
+    _urgency_value: int = field(default=0, init=False, repr=False)
+    _cached_dict: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # 预先取出枚举值，排序时直接读取整数属性
+        self._urgency_value = self.urgency.value
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为API返回的字典（缓存结果，状态变化时由队列清除）"""
+        if self._cached_dict is None:
+            self._cached_dict = {
+                "request_id": self.request_id,
+                "reason": self.reason.value,
+                "urgency": self.urgency.name,
+                "user_id": self.user_id,
+                "username": self.username,
+                "content": self.content,
+                "ai_suggestion": self.ai_suggestion,
+                "confidence": self.confidence,
+                "created_at": self.created_at.isoformat(),
+                "status": self.status
+            }
+        return self._cached_dict
 
 
-@dataclass
+@dataclass(slots=True)
 class AuditItem:
     """话术审核项"""
     item_id: str
@@ -75,11 +107,117 @@ class AuditItem:
     modified_response: Optional[str] = None
     reviewed_at: Optional[datetime] = None
     review_notes: Optional[str] = None
+    _risk_rank: int = field(default=0, init=False, repr=False)
+    _cached_dict: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # 风险等级取值有限，驻留后所有审核项共享同一字符串对象
+        self.risk_level = sys.intern(self.risk_level)
+        self._risk_rank = ResponseAuditQueue._RISK_ORDER.get(self.risk_level, 0)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为API返回的字典（缓存结果，状态变化时由队列清除）"""
+        if self._cached_dict is None:
+            self._cached_dict = {
+                "item_id": self.item_id,
+                "user_id": self.user_id,
+                "username": self.username,
+                "original_question": self.original_question,
+                "ai_response": self.ai_response,
+                "confidence": self.confidence,
+                "risk_level": self.risk_level,
+                "created_at": self.created_at.isoformat(),
+                "status": self.status.value
+            }
+        return self._cached_dict
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器
+    
+    将多组关键词编译为一个 Aho-Corasick 自动机，一次扫描返回命中的分组；
+    未安装 pyahocorasick 时退化为逐个子串查找。
+    
+    扫描前先做长度和首字符预检：文本短于最短关键词，或不含任何关键词的首字符时直接判定未命中。
+    """
+    
+    def __init__(self, keyword_groups: Dict[Any, Iterable[str]]):
+        """
+        参数:
+            keyword_groups: 分组 -> 关键词列表
+        """
+        self._pairs = [
+            (keyword, group)
+            for group, keywords in keyword_groups.items()
+            for keyword in keywords
+        ]
+        
+        # 预检用：最短关键词长度、所有关键词首字符集合（存在空关键词时不做预检）
+        self._min_len = min((len(keyword) for keyword, _ in self._pairs), default=0)
+        self._first_chars: Optional[frozenset] = (
+            frozenset(keyword[0] for keyword, _ in self._pairs)
+            if self._min_len > 0 else None
+        )
+        
+        self._automaton = None
+        if ahocorasick is not None and self._pairs:
+            # 同一关键词出现在多个分组时，保留所有分组
+            keyword_to_groups: Dict[str, tuple] = {}
+            for keyword, group in self._pairs:
+                groups = keyword_to_groups.get(keyword, ())
+                if group not in groups:
+                    keyword_to_groups[keyword] = groups + (group,)
+            
+            self._automaton = ahocorasick.Automaton()
+            for keyword, groups in keyword_to_groups.items():
+                self._automaton.add_word(keyword, groups)
+            self._automaton.make_automaton()
+    
+    def _may_match(self, text: str) -> bool:
+        """预检文本是否可能包含关键词"""
+        if not text or not self._pairs:
+            return False
+        if self._first_chars is None:
+            return True
+        return len(text) >= self._min_len and not self._first_chars.isdisjoint(text)
+    
+    def find_groups(self, text: str) -> Set[Any]:
+        """返回文本中命中的所有关键词分组"""
+        if not self._may_match(text):
+            return set()
+        
+        if self._automaton is not None:
+            matched = set()
+            for _, groups in self._automaton.iter(text):
+                matched.update(groups)
+            return matched
+        
+        return {group for keyword, group in self._pairs if keyword in text}
+    
+    def contains_any(self, text: str) -> bool:
+        """文本是否包含任一关键词"""
+        if not self._may_match(text):
+            return False
+        
+        if self._automaton is not None:
+            for _ in self._automaton.iter(text):
+                return True
+            return False
+        
+        return any(keyword in text for keyword, _ in self._pairs)
 
 
 class HumanTakeoverTrigger:
     """人工接管触发器"""
     
+    # 关键词触发的接管原因对应的紧急程度
+    KEYWORD_URGENCY = {
+        TakeoverReason.SEVERE_COMPLAINT: UrgencyLevel.HIGH,
+        TakeoverReason.ESCALATION_REQUEST: UrgencyLevel.MEDIUM,
+        TakeoverReason.BRAND_RISK: UrgencyLevel.HIGH
+    }
+    
     def __init__(
         self,
         low_confidence_threshold: float = 0.6,
@@ -107,10 +245,27 @@ class HumanTakeoverTrigger:
             "客服人员", "人工接听", "不要机器人"
         ]
         
-        # 待处理接管请求队列
+        # 品牌风险关键词
+        self.risk_keywords = ["虚假宣传", "价格欺诈", "质量问题", "安全隐患"]
+        
+        # 所有关键词编译为一个自动机，单次扫描消息
+        self._keyword_matcher = KeywordMatcher({
+            TakeoverReason.SEVERE_COMPLAINT: self.complaint_keywords,
+            TakeoverReason.ESCALATION_REQUEST: self.escalation_keywords,
+            TakeoverReason.BRAND_RISK: self.risk_keywords
+        })
+        
+        # 待处理接管请求队列（及按ID索引）
         self.pending_requests: deque = deque(maxlen=100)
-        self.total_takeovers = 0
-        self.resolved_takeovers = 0
+        self._index: Dict[str, TakeoverRequest] = {}
+        
+        # 按 (-紧急程度, 创建序号) 排列的堆；已解决或被挤出的请求延迟清理
+        self._heap: List[Tuple[int, int, TakeoverRequest]] = []
+        self._seq = 0
+        
+        # 统计计数（total / resolved），解决率在写入时更新
+        self._stats: Counter = Counter()
+        self._resolution_rate = 0.0
     
     def check_takeover_needed(
         self,
@@ -135,63 +290,32 @@ class HumanTakeoverTrigger:
         返回:
             TakeoverRequest if needed, None otherwise
         """
-        # 1. 检查投诉关键词
-        for keyword in self.complaint_keywords:
-            if keyword in content:
-                return self._create_takeover_request(
-                    user_id=user_id,
-                    username=username,
-                    content=content,
-                    reason=TakeoverReason.SEVERE_COMPLAINT,
-                    urgency=UrgencyLevel.HIGH,
-                    ai_suggestion=ai_response,
-                    confidence=confidence,
-                    context=context
-                )
-        
-        # 2. 检查转人工请求
-        for keyword in self.escalation_keywords:
-            if keyword in content:
-                return self._create_takeover_request(
-                    user_id=user_id,
-                    username=username,
-                    content=content,
-                    reason=TakeoverReason.ESCALATION_REQUEST,
-                    urgency=UrgencyLevel.MEDIUM,
-                    ai_suggestion=ai_response,
-                    confidence=confidence,
-                    context=context
-                )
-        
-        # 3. 检查低置信度
-        if confidence < self.low_confidence_threshold:
-            return self._create_takeover_request(
-                user_id=user_id,
-                username=username,
-                content=content,
-                reason=TakeoverReason.LOW_CONFIDENCE,
-                urgency=UrgencyLevel.MEDIUM,
-                ai_suggestion=ai_response,
-                confidence=confidence,
-                context=context
-            )
-        
-        # 4. 检查品牌风险关键词
-        risk_keywords = ["虚假宣传", "价格欺诈", "质量问题", "安全隐患"]
-        for keyword in risk_keywords:
-            if keyword in content:
-                return self._create_takeover_request(
-                    user_id=user_id,
-                    username=username,
-                    content=content,
-                    reason=TakeoverReason.BRAND_RISK,
-                    urgency=UrgencyLevel.HIGH,
-                    ai_suggestion=ai_response,
-                    confidence=confidence,
-                    context=context
-                )
-        
-        return None
+        matched = self._keyword_matcher.find_groups(content)
+        
+        # 按优先级确定接管原因：投诉 > 转人工 > 低置信度 > 品牌风险
+        reason = None
+        if TakeoverReason.SEVERE_COMPLAINT in matched:
+            reason = TakeoverReason.SEVERE_COMPLAINT
+        elif TakeoverReason.ESCALATION_REQUEST in matched:
+            reason = TakeoverReason.ESCALATION_REQUEST
+        elif confidence < self.low_confidence_threshold:
+            reason = TakeoverReason.LOW_CONFIDENCE
+        elif TakeoverReason.BRAND_RISK in matched:
+            reason = TakeoverReason.BRAND_RISK
+        
+        if reason is None:
+            return None
+        
+        return self._create_takeover_request(
+            user_id=user_id,
+            username=username,
+            content=content,
+            reason=reason,
+            urgency=self.KEYWORD_URGENCY.get(reason, UrgencyLevel.MEDIUM),
+            ai_suggestion=ai_response,
+            confidence=confidence,
+            context=context
+        )
     
     def _create_takeover_request(
         self,
@@ -205,10 +329,8 @@ class HumanTakeoverTrigger:
         context: Dict[str, Any] = None
     ) -> TakeoverRequest:
         """创建接管请求"""
-        import uuid
-        
         request = TakeoverRequest(
-            request_id=f"TK{int(time.time() * 1000)}",
+            request_id=f"TK{uuid.uuid4().hex[:12]}",
             reason=reason,
             urgency=urgency,
             user_id=user_id,
@@ -219,8 +341,17 @@ class HumanTakeoverTrigger:
             context=context or {}
         )
         
+        # 队列已满时最旧的请求会被挤出，同步移除其索引
+        if len(self.pending_requests) == self.pending_requests.maxlen:
+            self._index.pop(self.pending_requests[0].request_id, None)
         self.pending_requests.append(request)
-        self.total_takeovers += 1
+        self._index[request.request_id] = request
+        self._count("total")
+        
+        self._seq += 1
+        heapq.heappush(self._heap, (-request._urgency_value, self._seq, request))
+        if len(self._heap) > 2 * self.pending_requests.maxlen:
+            self._compact_heap()
         
         # 记录日志
         logger.warning(
@@ -240,15 +371,23 @@ class HumanTakeoverTrigger:
         返回:
             待处理请求列表
         """
-        requests = list(self.pending_requests)
-        
-        if urgency:
-            requests = [r for r in requests if r.urgency == urgency]
-        
-        # 按紧急程度排序
-        requests.sort(key=lambda r: r.urgency.value, reverse=True)
-        
-        return requests
+        # 堆本身已近似有序，排序开销很小；同等紧急程度按创建先后排列
+        return [
+            r for _, _, r in sorted(self._heap)
+            if self._is_live(r) and (not urgency or r.urgency == urgency)
+        ]
+    
+    def _is_live(self, request: TakeoverRequest) -> bool:
+        """请求是否仍待处理且未被挤出队列"""
+        return (
+            request.status == "pending"
+            and self._index.get(request.request_id) is request
+        )
+    
+    def _compact_heap(self):
+        """清理堆中已解决或已被挤出的请求"""
+        self._heap = [entry for entry in self._heap if self._is_live(entry[2])]
+        heapq.heapify(self._heap)
     
     def resolve_request(self, request_id: str, resolution: str) -> bool:
         """
@@ -261,33 +400,41 @@ class HumanTakeoverTrigger:
         返回:
             是否成功
         """
-        for request in self.pending_requests:
-            if request.request_id == request_id:
-                request.status = "resolved"
-                request.resolved_at = datetime.now()
-                self.resolved_takeovers += 1
-                
-                logger.info(f"✅ 接管请求已解决: {request_id}")
-                return True
+        request = self._index.get(request_id)
+        if request is None:
+            return False
         
-        return False
+        request.status = "resolved"
+        request.resolved_at = datetime.now()
+        request._cached_dict = None
+        self._count("resolved")
+        
+        logger.info(f"✅ 接管请求已解决: {request_id}")
+        return True
+    
+    def _count(self, key: str):
+        """更新统计计数及解决率"""
+        stats = self._stats
+        stats[key] += 1
+        self._resolution_rate = stats["resolved"] / max(stats["total"], 1)
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取接管统计"""
+        stats = self._stats
         return {
-            "total_takeovers": self.total_takeovers,
-            "resolved_takeovers": self.resolved_takeovers,
+            "total_takeovers": stats["total"],
+            "resolved_takeovers": stats["resolved"],
             "pending_takeovers": len(self.pending_requests),
-            "resolution_rate": (
-                self.resolved_takeovers / self.total_takeovers 
-                if self.total_takeovers > 0 else 0
-            )
+            "resolution_rate": self._resolution_rate
         }
 
 
 class ResponseAuditQueue:
     """话术审核队列"""
     
+    # 风险等级排序权重
+    _RISK_ORDER: ClassVar[Dict[str, int]] = {"high": 3, "medium": 2, "low": 1}
+    
     def __init__(
         self,
         audit_keywords: List[str] = None,
@@ -306,14 +453,18 @@ class ResponseAuditQueue:
         
         self.confidence_threshold = confidence_threshold
         
-        # 审核队列
+        self._keyword_matcher = KeywordMatcher({"audit": self.audit_keywords})
+        
+        # 审核队列（及按ID索引）
         self.audit_queue: deque = deque(maxlen=100)
+        self._index: Dict[str, AuditItem] = {}
         
-        # 统计
-        self.total_submitted = 0
-        self.total_approved = 0
-        self.total_rejected = 0
-        self.total_modified = 0
+        # 待审核项（按提交顺序），审核后移除
+        self._pending: "OrderedDict[str, AuditItem]" = OrderedDict()
+        
+        # 统计计数（submitted 及各审核状态），通过率在写入时更新
+        self._stats: Counter = Counter()
+        self._approval_rate = 0.0
     
     def submit_for_audit(
         self,
@@ -345,12 +496,10 @@ class ResponseAuditQueue:
         if confidence < self.confidence_threshold:
             needs_audit = True
         
-        # 2. 包含审核关键词需要审核
-        for keyword in self.audit_keywords:
-            if keyword in original_question or keyword in ai_response:
-                needs_audit = True
-                risk_level = "high"
-                break
+        # 2. 包含审核关键词需要审核（问题与回复以分隔符拼接后单次扫描）
+        if self._keyword_matcher.contains_any(f"{original_question}\x00{ai_response}"):
+            needs_audit = True
+            risk_level = "high"
         
         # 3. 高风险等级需要审核
         if risk_level == "high":
@@ -360,10 +509,8 @@ class ResponseAuditQueue:
             return None
         
         # 创建审核项
-        import uuid
-        
         item = AuditItem(
-            item_id=f"AU{int(time.time() * 1000)}",
+            item_id=f"AU{uuid.uuid4().hex[:12]}",
             user_id=user_id,
             username=username,
             original_question=original_question,
@@ -372,8 +519,15 @@ class ResponseAuditQueue:
             risk_level=risk_level
         )
         
+        # 队列已满时最旧的审核项会被挤出，同步移除其索引
+        if len(self.audit_queue) == self.audit_queue.maxlen:
+            evicted_id = self.audit_queue[0].item_id
+            self._index.pop(evicted_id, None)
+            self._pending.pop(evicted_id, None)
         self.audit_queue.append(item)
-        self.total_submitted += 1
+        self._index[item.item_id] = item
+        self._pending[item.item_id] = item
+        self._count("submitted")
         
         logger.info(
             f"📝 提交话术审核: 用户={username}, "
@@ -392,14 +546,13 @@ class ResponseAuditQueue:
         返回:
             待审核项列表
         """
-        items = [item for item in self.audit_queue if item.status == AuditStatus.PENDING]
-        
         if risk_level:
-            items = [item for item in items if item.risk_level == risk_level]
+            items = [item for item in self._pending.values() if item.risk_level == risk_level]
+        else:
+            items = list(self._pending.values())
         
         # 按风险等级排序
-        risk_order = {"high": 3, "medium": 2, "low": 1}
-        items.sort(key=lambda i: risk_order.get(i.risk_level, 0), reverse=True)
+        items.sort(key=attrgetter("_risk_rank"), reverse=True)
         
         return items
     
@@ -414,18 +567,20 @@ class ResponseAuditQueue:
         返回:
             是否成功
         """
-        for item in self.audit_queue:
-            if item.item_id == item_id:
-                item.status = AuditStatus.APPROVED
-                item.reviewer = reviewer
-                item.reviewed_at = datetime.now()
-                
-                self.total_approved += 1
-                
-                logger.info(f"✅ 话术审核通过: {item_id}")
-                return True
+        item = self._index.get(item_id)
+        if item is None:
+            return False
+        
+        self._pending.pop(item_id, None)
+        item.status = AuditStatus.APPROVED
+        item.reviewer = reviewer
+        item.reviewed_at = datetime.now()
+        item._cached_dict = None
+        
+        self._count(AuditStatus.APPROVED.value)
         
-        return False
+        logger.info(f"✅ 话术审核通过: {item_id}")
+        return True
     
     def reject_item(self, item_id: str, reviewer: str, notes: str = "") -> bool:
         """
@@ -439,19 +594,21 @@ class ResponseAuditQueue:
         返回:
             是否成功
         """
-        for item in self.audit_queue:
-            if item.item_id == item_id:
-                item.status = AuditStatus.REJECTED
-                item.reviewer = reviewer
-                item.reviewed_at = datetime.now()
-                item.review_notes = notes
-                
-                self.total_rejected += 1
-                
-                logger.info(f"❌ 话术审核拒绝: {item_id}")
-                return True
+        item = self._index.get(item_id)
+        if item is None:
+            return False
+        
+        self._pending.pop(item_id, None)
+        item.status = AuditStatus.REJECTED
+        item.reviewer = reviewer
+        item.reviewed_at = datetime.now()
+        item._cached_dict = None
+        item.review_notes = notes
+        
+        self._count(AuditStatus.REJECTED.value)
         
-        return False
+        logger.info(f"❌ 话术审核拒绝: {item_id}")
+        return True
     
     def modify_item(
         self,
@@ -472,33 +629,39 @@ class ResponseAuditQueue:
         返回:
             是否成功
         """
-        for item in self.audit_queue:
-            if item.item_id == item_id:
-                item.status = AuditStatus.MODIFIED
-                item.reviewer = reviewer
-                item.modified_response = modified_response
-                item.reviewed_at = datetime.now()
-                item.review_notes = notes
-                
-                self.total_modified += 1
-                
-                logger.info(f"✏️ 话术已修改: {item_id}")
-                return True
-        
-        return False
+        item = self._index.get(item_id)
+        if item is None:
+            return False
+        
+        self._pending.pop(item_id, None)
+        item.status = AuditStatus.MODIFIED
+        item.reviewer = reviewer
+        item.modified_response = modified_response
+        item.reviewed_at = datetime.now()
+        item._cached_dict = None
+        item.review_notes = notes
+        
+        self._count(AuditStatus.MODIFIED.value)
+        
+        logger.info(f"✏️ 话术已修改: {item_id}")
+        return True
+    
+    def _count(self, key: str):
+        """更新统计计数及通过率"""
+        stats = self._stats
+        stats[key] += 1
+        self._approval_rate = stats[AuditStatus.APPROVED.value] / max(stats["submitted"], 1)
     
     def get_statistics(self) -> Dict[str, Any]:
         """获取审核统计"""
+        stats = self._stats
         return {
-            "total_submitted": self.total_submitted,
-            "total_approved": self.total_approved,
-            "total_rejected": self.total_rejected,
-            "total_modified": self.total_modified,
-            "pending_items": len([i for i in self.audit_queue if i.status == AuditStatus.PENDING]),
-            "approval_rate": (
-                self.total_approved / self.total_submitted 
-                if self.total_submitted > 0 else 0
-            )
+            "total_submitted": stats["submitted"],
+            "total_approved": stats[AuditStatus.APPROVED.value],
+            "total_rejected": stats[AuditStatus.REJECTED.value],
+            "total_modified": stats[AuditStatus.MODIFIED.value],
+            "pending_items": len(self._pending),
+            "approval_rate": self._approval_rate
         }
 
 
@@ -507,10 +670,6 @@ takeover_trigger = HumanTakeoverTrigger()
 audit_queue = ResponseAuditQueue()
 
 
-# 需要导入time
-import time
-
-
 class HumanCollaborationAPI:
     """
     人机协作API
@@ -526,41 +685,14 @@ class HumanCollaborationAPI:
         urgency_enum = UrgencyLevel[urgency] if urgency else None
         requests = takeover_trigger.get_pending_requests(urgency_enum)
         
-        return [
-            {
-                "request_id": r.request_id,
-                "reason": r.reason.value,
-                "urgency": r.urgency.name,
-                "user_id": r.user_id,
-                "username": r.username,
-                "content": r.content,
-                "ai_suggestion": r.ai_suggestion,
-                "confidence": r.confidence,
-                "created_at": r.created_at.isoformat(),
-                "status": r.status
-            }
-            for r in requests
-        ]
+        return [r.to_dict() for r in requests]
     
     @staticmethod
     def get_audit_items(risk_level: str = None) -> List[Dict]:
         """获取审核项列表"""
         items = audit_queue.get_pending_items(risk_level)
         
-        return [
-            {
-                "item_id": i.item_id,
-                "user_id": i.user_id,
-                "username": i.username,
-                "original_question": i.original_question,
-                "ai_response": i.ai_response,
-                "confidence": i.confidence,
-                "risk_level": i.risk_level,
-                "created_at": i.created_at.isoformat(),
-                "status": i.status.value
-            }
-            for i in items
-        ]
+        return [i.to_dict() for i in items]
     
     @staticmethod
     def approve_audit_item(item_id: str, reviewer: str) -> Dict:
@@ -5,11 +5,18 @@
 
 import logging
 import asyncio
+import contextlib
 import os
 import csv
 import json
-from typing import List, Dict, Any
-from datetime import datetime
+import time
+import itertools
+from typing import List, Dict, Any, Iterable, Tuple, AsyncIterator
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +28,222 @@ class KnowledgeBaseImporter:
     支持从多种格式导入商品说明书和QA
     """
     
-    def __init__(self):
+    def __init__(self, batch_size: int = 512, concurrency: int = 8):
+        """
+        参数:
+            batch_size: 每批提交给知识库的文档数
+            concurrency: 同时写入的批次数上限
+        """
         self.imported_count = 0
         self.failed_count = 0
+        
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: List[asyncio.Task] = []
+    
+    async def _flush_batch(
+        self,
+        batch: List[Tuple[str, str, Dict[str, Any]]],
+        knowledge_base_tool
+    ):
+        """将已累积的文档作为一个批次提交写入，并清空批次"""
+        if not batch:
+            return
+        
+        doc_ids, contents, metadatas = map(list, zip(*batch))
+        batch.clear()
+        
+        await self._submit_batch(doc_ids, contents, metadatas, knowledge_base_tool)
+    
+    async def _submit_batch(
+        self,
+        doc_ids: List[str],
+        contents: List[str],
+        metadatas: List[Dict[str, Any]],
+        knowledge_base_tool
+    ):
+        """按列提交一个批次写入"""
+        # 在途批次达到并发上限时等待，避免读取速度远超写入速度时无限堆积
+        await self._semaphore.acquire()
+        self._pending.append(
+            asyncio.create_task(
+                self._write_batch(doc_ids, contents, metadatas, knowledge_base_tool)
+            )
+        )
+    
+    async def _write_batch(
+        self,
+        doc_ids: List[str],
+        contents: List[str],
+        metadatas: List[Dict[str, Any]],
+        knowledge_base_tool
+    ):
+        """写入一个批次"""
+        try:
+            success = await knowledge_base_tool.add_knowledge_bulk(
+                doc_ids, contents, metadatas
+            )
+        except Exception as e:
+            logger.error(f"批量导入失败: {len(doc_ids)}条, 错误: {str(e)}")
+            success = 0
+        finally:
+            self._semaphore.release()
+        
+        self.imported_count += success
+        self.failed_count += len(doc_ids) - success
+    
+    @staticmethod
+    def _bulk_context(knowledge_base_tool):
+        """知识库提供 bulk_import() 时返回该上下文，否则返回空上下文"""
+        bulk_import = getattr(knowledge_base_tool, "bulk_import", None)
+        return bulk_import() if bulk_import is not None else contextlib.nullcontext()
+    
+    @staticmethod
+    async def _iter_off_loop(iterable: Iterable, size: int) -> AsyncIterator[List[Any]]:
+        """
+        在工作线程中每次取出至多 size 个元素并逐批产出
+        
+        文件读取和解析在线程中进行，事件循环可以同时处理在途批次的写入
+        """
+        iterator = iter(iterable)
+        while chunk := await asyncio.to_thread(list, itertools.islice(iterator, size)):
+            yield chunk
+    
+    async def _wait_pending(self):
+        """等待所有在途批次写入完成"""
+        pending, self._pending = self._pending, []
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"批量导入任务异常: {str(result)}")
+    
+    async def _import_csv_rows(self, file_path: str, knowledge_base_tool):
+        """使用csv模块逐行读取并导入"""
+        batch: List[Tuple[str, str, Dict[str, Any]]] = []
+        base_ts = int(time.time())
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            
+            # 读取表头后按列下标取值，避免每行构建字典
+            columns = {name: i for i, name in enumerate(next(reader, []))}
+            product_id_i = columns['product_id']
+            product_name_i = columns['product_name']
+            content_i = columns['content']
+            category_i = columns.get('category')
+            chunk_type_i = columns.get('chunk_type')
+            
+            # 数据行序号（从0开始，不含空行），作为文档ID后缀，与pandas分块读取一致
+            data_rows = 0
+            
+            async for rows in self._iter_off_loop(reader, self.batch_size):
+                for row in rows:
+                    # 与pandas一致：跳过空行和只含空白的行，不计入序号
+                    if not row or (len(row) == 1 and not row[0].strip()):
+                        continue
+                    row_index = data_rows
+                    data_rows += 1
+                    
+                    try:
+                        # 构建文档
+                        product_id = row[product_id_i]
+                        content = row[content_i]
+                        
+                        # 商品ID或内容为空的行记为失败（与pandas分块读取一致）
+                        if not product_id or not content:
+                            self.failed_count += 1
+                            continue
+                        
+                        doc_id = f"{product_id}_{base_ts}_{row_index}"
+                        
+                        batch.append((
+                            doc_id,
+                            content,
+                            {
+                                "product_id": product_id,
+                                "product_name": row[product_name_i],
+                                "category": row[category_i] if category_i is not None else 'general',
+                                "chunk_type": row[chunk_type_i] if chunk_type_i is not None else 'description'
+                            }
+                        ))
+                        
+                    except Exception as e:
+                        logger.error(f"导入行失败: {row}, 错误: {str(e)}")
+                        self.failed_count += 1
+                        continue
+                    
+                    if len(batch) >= self.batch_size:
+                        await self._flush_batch(batch, knowledge_base_tool)
+        
+        await self._flush_batch(batch, knowledge_base_tool)
+    
+    async def _import_csv_chunks(self, pd, file_path: str, knowledge_base_tool):
+        """使用pandas C解析器按批次大小分块读取并导入"""
+        base_ts = int(time.time())
+        chunks = await asyncio.to_thread(
+            pd.read_csv,
+            file_path,
+            engine='c',
+            dtype=str,
+            na_filter=False,
+            chunksize=self.batch_size
+        )
+        
+        # 已读取的数据行数（pandas已跳过空行），用于计算文档ID后缀
+        row_offset = 0
+        
+        try:
+            async for (chunk,) in self._iter_off_loop(chunks, 1):
+                # 商品ID或内容为空的行记为失败
+                mask = ((chunk['product_id'] != '') & (chunk['content'] != '')).to_numpy()
+                valid = chunk[mask]
+                self.failed_count += len(chunk) - len(valid)
+                
+                # 有效行在文件中的数据行序号（从0开始），与csv模块逐行读取一致
+                row_indices = (mask.nonzero()[0] + row_offset).tolist()
+                row_offset += len(chunk)
+                if valid.empty:
+                    continue
+                
+                size = len(valid)
+                product_ids = valid['product_id'].tolist()
+                product_names = valid['product_name'].tolist()
+                categories = (
+                    valid['category'].tolist()
+                    if 'category' in valid else ['general'] * size
+                )
+                chunk_types = (
+                    valid['chunk_type'].tolist()
+                    if 'chunk_type' in valid else ['description'] * size
+                )
+                
+                # 各列直接作为批次提交，不再逐行组装再转置
+                doc_ids = [
+                    f"{product_id}_{base_ts}_{row_index}"
+                    for row_index, product_id in zip(row_indices, product_ids)
+                ]
+                metadatas = [
+                    {
+                        "product_id": product_id,
+                        "product_name": product_name,
+                        "category": category,
+                        "chunk_type": chunk_type
+                    }
+                    for product_id, product_name, category, chunk_type in zip(
+                        product_ids, product_names, categories, chunk_types
+                    )
+                ]
+                await self._submit_batch(
+                    doc_ids, valid['content'].tolist(), metadatas, knowledge_base_tool
+                )
+        finally:
+            chunks.close()
     
     async def import_from_csv(
         self,
         file_path: str,
-        knowledge_base_tool  # KnowledgeBaseTool实例
+        knowledge_base_tool  # 知识库实例（需提供 add_knowledge_bulk，如 VectorDatabase）
     ) -> Dict[str, Any]:
         """
         从CSV导入
@@ -44,30 +259,19 @@ class KnowledgeBaseImporter:
             导入结果
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
+            # 知识库支持批量导入模式时，导入期间延迟重建索引
+            async with self._bulk_context(knowledge_base_tool):
+                try:
+                    import pandas as pd
+                except ImportError:
+                    pd = None
                 
-                for row in reader:
-                    try:
-                        # 构建文档
-                        doc_id = f"{row['product_id']}_{datetime.now().timestamp()}"
-                        
-                        await knowledge_base_tool.add_knowledge(
-                            doc_id=doc_id,
-                            content=row['content'],
-                            metadata={
-                                "product_id": row['product_id'],
-                                "product_name": row['product_name'],
-                                "category": row.get('category', 'general'),
-                                "chunk_type": row.get('chunk_type', 'description')
-                            }
-                        )
-                        
-                        self.imported_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"导入行失败: {row}, 错误: {str(e)}")
-                        self.failed_count += 1
+                # 安装了pandas时用其C解析器分块读取，否则用csv模块逐行读取
+                if pd is not None:
+                    await self._import_csv_chunks(pd, file_path, knowledge_base_tool)
+                else:
+                    await self._import_csv_rows(file_path, knowledge_base_tool)
+                await self._wait_pending()
             
             logger.info(f"✅ CSV导入完成: 成功{self.imported_count}, 失败{self.failed_count}")
             
@@ -77,6 +281,7 @@ class KnowledgeBaseImporter:
             }
             
         except Exception as e:
+            await self._wait_pending()
             logger.error(f"❌ CSV导入失败: {str(e)}")
             return {
                 "imported": 0,
@@ -114,63 +319,105 @@ class KnowledgeBaseImporter:
             导入结果
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            for product in data:
-                # 导入商品基本信息
-                product_desc = self._build_product_description(product)
+            with open(file_path, 'rb') as f:
+                # 安装了 ijson 时流式逐个解析商品，内存占用与文件大小无关
+                if ijson is not None:
+                    # 流式解析只产出顶层数组的元素，先确认顶层是数组再从头解析
+                    first_event = next(ijson.parse(f), None)
+                    if first_event is None or first_event[1] != 'start_array':
+                        raise ValueError("JSON顶层必须是商品数组")
+                    f.seek(0)
+                    products = ijson.items(f, 'item', use_float=True)
+                else:
+                    products = await asyncio.to_thread(json.load, f)
+                    if not isinstance(products, list):
+                        raise ValueError("JSON顶层必须是商品数组")
                 
-                doc_id = f"{product['product_id']}_desc"
-                
-                await knowledge_base_tool.add_knowledge(
-                    doc_id=doc_id,
-                    content=product_desc,
-                    metadata={
-                        "product_id": product['product_id'],
-                        "product_name": product['product_name'],
-                        "chunk_type": "product_description"
-                    }
-                )
-                
-                self.imported_count += 1
+                return await self._import_products(products, knowledge_base_tool)
+            
+        except Exception as e:
+            logger.error(f"❌ JSON导入失败: {str(e)}")
+            return {
+                "imported": 0,
+                "failed": 0,
+                "error": str(e)
+            }
+    
+    async def _import_products(
+        self,
+        products: Iterable[Dict[str, Any]],
+        knowledge_base_tool
+    ) -> Dict[str, Any]:
+        """
+        导入商品数据
+        
+        参数:
+            products: 商品字典的可迭代对象（格式同 import_from_json），可以是流式解析结果或内存中的列表
+            knowledge_base_tool: 知识库工具实例
+        
+        返回:
+            导入结果
+        """
+        try:
+            # 知识库支持批量导入模式时，导入期间延迟重建索引
+            async with self._bulk_context(knowledge_base_tool):
+                batch: List[Tuple[str, str, Dict[str, Any]]] = []
                 
-                # 导入QA
-                if 'qas' in product:
-                    for idx, qa in enumerate(product['qas']):
-                        qa_doc_id = f"{product['product_id']}_qa_{idx}"
-                        qa_content = f"Q: {qa['question']}\nA: {qa['answer']}"
+                async for chunk in self._iter_off_loop(products, self.batch_size):
+                    for product in chunk:
+                        # 导入商品基本信息
+                        product_desc = self._build_product_description(product)
+                        
+                        doc_id = f"{product['product_id']}_desc"
                         
-                        await knowledge_base_tool.add_knowledge(
-                            doc_id=qa_doc_id,
-                            content=qa_content,
-                            metadata={
+                        batch.append((
+                            doc_id,
+                            product_desc,
+                            {
                                 "product_id": product['product_id'],
                                 "product_name": product['product_name'],
-                                "chunk_type": "qa"
+                                "chunk_type": "product_description"
                             }
-                        )
+                        ))
                         
-                        self.imported_count += 1
-                
-                # 导入规格参数
-                if 'specifications' in product:
-                    spec_content = self._build_specifications(product)
-                    spec_doc_id = f"{product['product_id']}_spec"
-                    
-                    await knowledge_base_tool.add_knowledge(
-                        doc_id=spec_doc_id,
-                        content=spec_content,
-                        metadata={
-                            "product_id": product['product_id'],
-                            "product_name": product['product_name'],
-                            "chunk_type": "specifications"
-                        }
-                    )
+                        # 导入QA
+                        if 'qas' in product:
+                            for idx, qa in enumerate(product['qas']):
+                                qa_doc_id = f"{product['product_id']}_qa_{idx}"
+                                qa_content = f"Q: {qa['question']}\nA: {qa['answer']}"
+                                
+                                batch.append((
+                                    qa_doc_id,
+                                    qa_content,
+                                    {
+                                        "product_id": product['product_id'],
+                                        "product_name": product['product_name'],
+                                        "chunk_type": "qa"
+                                    }
+                                ))
+                        
+                        # 导入规格参数
+                        if 'specifications' in product:
+                            spec_content = self._build_specifications(product)
+                            spec_doc_id = f"{product['product_id']}_spec"
+                            
+                            batch.append((
+                                spec_doc_id,
+                                spec_content,
+                                {
+                                    "product_id": product['product_id'],
+                                    "product_name": product['product_name'],
+                                    "chunk_type": "specifications"
+                                }
+                            ))
+                        
+                        if len(batch) >= self.batch_size:
+                            await self._flush_batch(batch, knowledge_base_tool)
                     
-                    self.imported_count += 1
+                await self._flush_batch(batch, knowledge_base_tool)
+                await self._wait_pending()
             
-            logger.info(f"✅ JSON导入完成: 成功{self.imported_count}")
+            logger.info(f"✅ 商品数据导入完成: 成功{self.imported_count}")
             
             return {
                 "imported": self.imported_count,
@@ -178,7 +425,8 @@ class KnowledgeBaseImporter:
             }
             
         except Exception as e:
-            logger.error(f"❌ JSON导入失败: {str(e)}")
+            await self._wait_pending()
+            logger.error(f"❌ 商品数据导入失败: {str(e)}")
             return {
                 "imported": 0,
                 "failed": 0,
@@ -189,33 +437,31 @@ class KnowledgeBaseImporter:
         """构建商品描述"""
         parts = [f"商品名称: {product['product_name']}"]
         
-        if 'brand' in product:
-            parts.append(f"品牌: {product['brand']}")
+        if (brand := product.get('brand')) is not None:
+            parts.append(f"品牌: {brand}")
         
-        if 'category' in product:
-            parts.append(f"分类: {product['category']}")
+        if (category := product.get('category')) is not None:
+            parts.append(f"分类: {category}")
         
-        if 'price' in product:
-            parts.append(f"价格: ¥{product['price']}")
+        if (price := product.get('price')) is not None:
+            parts.append(f"价格: ¥{price}")
         
-        if 'description' in product:
-            parts.append(f"商品描述: {product['description']}")
+        if (description := product.get('description')) is not None:
+            parts.append(f"商品描述: {description}")
         
-        if 'highlights' in product:
-            parts.append(f"商品亮点: {', '.join(product['highlights'])}")
+        if (highlights := product.get('highlights')) is not None:
+            parts.append(f"商品亮点: {', '.join(highlights)}")
         
         return "\n".join(parts)
     
     def _build_specifications(self, product: Dict) -> str:
         """构建规格说明"""
-        parts = [f"商品: {product['product_name']} 规格参数"]
-        
-        specs = product.get('specifications', {})
+        specs = product.get('specifications') or {}
         
-        for key, value in specs.items():
-            parts.append(f"{key}: {value}")
-        
-        return "\n".join(parts)
+        return "\n".join([
+            f"商品: {product['product_name']} 规格参数",
+            *(f"{key}: {value}" for key, value in specs.items())
+        ])
 
 
 async def import_sample_knowledge():
@@ -224,7 +470,7 @@ async def import_sample_knowledge():
     
     包含常见商品的说明书和QA
     """
-    from tools.knowledge_base_tool import KnowledgeBaseTool
+    from tools.knowledge_base_tool import product_knowledge_base
     from storage.vector_db_persistent import get_vector_db
     
     # 示例商品数据
@@ -327,19 +573,14 @@ async def import_sample_knowledge():
     # 初始化向量数据库
     vector_db = await get_vector_db()
     
-    # 创建知识库工具
-    knowledge_tool = KnowledgeBaseTool()
+    # 知识库（提供 add_knowledge_bulk 批量写入）
+    knowledge_tool = product_knowledge_base.vector_db
     
     # 导入数据
     importer = KnowledgeBaseImporter()
     
-    # 将数据保存为临时JSON文件
-    temp_file = "/tmp/sample_knowledge.json"
-    with open(temp_file, 'w', encoding='utf-8') as f:
-        json.dump(sample_products, f, ensure_ascii=False, indent=2)
-    
-    # 导入
-    result = await importer.import_from_json(temp_file, knowledge_tool)
+    # 示例数据已在内存中，直接导入
+    result = await importer._import_products(sample_products, knowledge_tool)
     
     logger.info(f"✅ 示例知识库导入完成: {result}")
     
@@ -4,24 +4,46 @@
 """
 
 import asyncio
+import hashlib
 import logging
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, Any, List
-from datetime import datetime, timedelta
-from collections import deque
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
 
+from .monitoring_common import RingBuffer, json_response
+
 logger = logging.getLogger(__name__)
 
 
 class PerformanceMetrics:
     """性能指标收集器"""
     
+    __slots__ = (
+        "max_history",
+        "_history",
+        "start_time",
+        "current",
+        "total_danmaku_processed",
+        "total_errors",
+        "cache_hits",
+        "cache_misses",
+        "avg_response_time_sum",
+        "response_count",
+        "_metrics_snapshot",
+        "_stats_snapshot"
+    )
+    
     def __init__(self, max_history: int = 1000):
         self.max_history = max_history
-        self.metrics_history = deque(maxlen=max_history)
+        
+        # 指标历史：每个指标一个环形缓冲，查询时只访问该指标的数据
+        self._history: Dict[str, RingBuffer] = {}
+        
         self.start_time = time.time()
         
         # 当前指标
@@ -39,83 +61,101 @@ class PerformanceMetrics:
             "total_errors": 0
         }
         
-        # 统计数据
-        self.stats = {
-            "total_danmaku_processed": 0,
-            "total_errors": 0,
-            "cache_hits": 0,
-            "cache_misses": 0,
-            "avg_response_time_sum": 0.0,
-            "response_count": 0
-        }
+        # 统计数据（标量属性，记录事件时只做一次属性累加）
+        self.total_danmaku_processed = 0
+        self.total_errors = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.avg_response_time_sum = 0.0
+        self.response_count = 0
+        
+        # get_current_metrics / get_stats 复用的返回字典
+        self._metrics_snapshot: Dict[str, Any] = {}
+        self._stats_snapshot: Dict[str, Any] = {}
     
     def record_metric(self, metric_name: str, value: float):
         """记录指标"""
         self.current[metric_name] = value
         
         # 记录到历史
-        self.metrics_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "metric": metric_name,
-            "value": value
-        })
+        series = self._history.get(metric_name)
+        if series is None:
+            series = self._history[metric_name] = RingBuffer(self.max_history)
+        series.push(time.time(), value)
     
     def record_danmaku(self, response_time: float):
         """记录弹幕处理"""
-        self.stats["total_danmaku_processed"] += 1
-        self.stats["avg_response_time_sum"] += response_time
-        self.stats["response_count"] += 1
-        
-        self.current["total_danmaku"] = self.stats["total_danmaku_processed"]
-        self.current["avg_response_time"] = (
-            self.stats["avg_response_time_sum"] / self.stats["response_count"]
-        )
+        self.total_danmaku_processed += 1
+        self.avg_response_time_sum += response_time
+        self.response_count += 1
     
     def record_cache_hit(self, hit: bool):
         """记录缓存命中"""
         if hit:
-            self.stats["cache_hits"] += 1
+            self.cache_hits += 1
         else:
-            self.stats["cache_misses"] += 1
-        
-        total = self.stats["cache_hits"] + self.stats["cache_misses"]
-        if total > 0:
-            self.current["cache_hit_rate"] = self.stats["cache_hits"] / total
+            self.cache_misses += 1
     
     def record_error(self):
         """记录错误"""
-        self.stats["total_errors"] += 1
-        self.current["total_errors"] = self.stats["total_errors"]
+        self.total_errors += 1
+    
+    def _refresh_derived(self):
+        """根据累计计数计算派生指标（只在读取时计算，记录时仅累加计数）"""
+        current = self.current
+        
+        current["total_danmaku"] = self.total_danmaku_processed
+        current["total_errors"] = self.total_errors
+        if self.response_count:
+            current["avg_response_time"] = self.avg_response_time_sum / self.response_count
+        
+        total = self.cache_hits + self.cache_misses
+        if total:
+            current["cache_hit_rate"] = self.cache_hits / total
     
     def get_current_metrics(self) -> Dict[str, Any]:
-        """获取当前指标"""
-        return {
-            **self.current,
-            "uptime": time.time() - self.start_time,
-            "timestamp": datetime.now().isoformat()
-        }
+        """
+        获取当前指标
+        
+        返回的字典在每次调用时原地更新并复用，timestamp 为 datetime 对象，由 orjson 序列化
+        """
+        self._refresh_derived()
+        snapshot = self._metrics_snapshot
+        snapshot.update(self.current)
+        snapshot["uptime"] = time.time() - self.start_time
+        snapshot["timestamp"] = datetime.now()
+        return snapshot
     
     def get_stats(self) -> Dict[str, Any]:
-        """获取统计数据"""
-        return {
-            **self.stats,
-            "uptime": time.time() - self.start_time,
-            "cache_hit_rate": self.current["cache_hit_rate"],
-            "avg_response_time": self.current["avg_response_time"]
-        }
+        """获取统计数据（返回的字典在每次调用时原地更新并复用）"""
+        self._refresh_derived()
+        snapshot = self._stats_snapshot
+        snapshot["total_danmaku_processed"] = self.total_danmaku_processed
+        snapshot["total_errors"] = self.total_errors
+        snapshot["cache_hits"] = self.cache_hits
+        snapshot["cache_misses"] = self.cache_misses
+        snapshot["avg_response_time_sum"] = self.avg_response_time_sum
+        snapshot["response_count"] = self.response_count
+        snapshot["uptime"] = time.time() - self.start_time
+        snapshot["cache_hit_rate"] = self.current["cache_hit_rate"]
+        snapshot["avg_response_time"] = self.current["avg_response_time"]
+        return snapshot
     
     def get_metrics_history(
         self,
         metric_name: str,
         minutes: int = 10
     ) -> List[Dict[str, Any]]:
-        """获取指标历史"""
-        cutoff = datetime.now() - timedelta(minutes=minutes)
+        """获取指标历史（timestamp 为 Unix 时间戳）"""
+        series = self._history.get(metric_name)
+        if series is None:
+            return []
+        
+        ts, values = series.since(time.time() - minutes * 60)
         
         return [
-            m for m in self.metrics_history
-            if m["metric"] == metric_name
-            and datetime.fromisoformat(m["timestamp"]) >= cutoff
+            {"timestamp": t, "metric": metric_name, "value": value}
+            for t, value in zip(ts.tolist(), values.tolist())
         ]
 
 
@@ -126,34 +166,66 @@ performance_metrics = PerformanceMetrics()
 class MonitoringAPI:
     """监控API"""
     
+    # 仪表板HTML的浏览器缓存时间（秒）
+    DASHBOARD_MAX_AGE = 300
+    # 响应体超过该字节数时启用gzip压缩
+    GZIP_MINIMUM_SIZE = 512
+    
     def __init__(self):
-        self.app = FastAPI(title="Live AI Assistant - Monitoring API")
+        self.app = FastAPI(
+            title="Live AI Assistant - Monitoring API",
+            lifespan=self._lifespan
+        )
+        self.app.add_middleware(GZipMiddleware, minimum_size=self.GZIP_MINIMUM_SIZE)
+        
+        # 仪表板HTML为静态内容，启动时生成一次并计算ETag
+        self._dashboard_html = self._generate_dashboard_html().encode("utf-8")
+        self._dashboard_etag = f'"{hashlib.sha1(self._dashboard_html).hexdigest()}"'
+        self._dashboard_headers = {
+            "Cache-Control": f"public, max-age={self.DASHBOARD_MAX_AGE}",
+            "ETag": self._dashboard_etag
+        }
+        
         self._setup_routes()
     
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """停止时处理完剩余的告警/恢复任务并关闭错误处理器"""
+        try:
+            yield
+        finally:
+            from .error_handler import error_handler
+            await error_handler.close()
+    
     def _setup_routes(self):
         """设置路由"""
         
         @self.app.get("/")
-        async def dashboard():
+        async def dashboard(request: Request):
             """监控仪表板"""
-            html_content = self._generate_dashboard_html()
-            return HTMLResponse(content=html_content)
+            if request.headers.get("if-none-match") == self._dashboard_etag:
+                return Response(status_code=304, headers=self._dashboard_headers)
+            return HTMLResponse(content=self._dashboard_html, headers=self._dashboard_headers)
         
         @self.app.get("/api/metrics")
         async def get_metrics():
             """获取当前指标"""
-            return JSONResponse(content=performance_metrics.get_current_metrics())
+            return json_response(performance_metrics.get_current_metrics())
         
         @self.app.get("/api/stats")
         async def get_stats():
             """获取统计数据"""
-            return JSONResponse(content=performance_metrics.get_stats())
+            return json_response(performance_metrics.get_stats())
         
         @self.app.get("/api/history/{metric_name}")
         async def get_metric_history(metric_name: str, minutes: int = 10):
             """获取指标历史"""
             history = performance_metrics.get_metrics_history(metric_name, minutes)
-            return JSONResponse(content=history)
+            
+            # 时间戳只在返回时转换，由 orjson 序列化为 ISO 字符串
+            for entry in history:
+                entry["timestamp"] = datetime.fromtimestamp(entry["timestamp"])
+            return json_response(history)
         
         @self.app.get("/api/health")
         async def health_check():
@@ -170,11 +242,11 @@ class MonitoringAPI:
             if pool_stats["failed"] > 2 or error_stats["unresolved_errors"] > 5:
                 health_status = "unhealthy"
             
-            return JSONResponse(content={
+            return json_response({
                 "status": health_status,
                 "websocket": pool_stats,
                 "errors": error_stats,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now()
             })
     
     def _generate_dashboard_html(self) -> str:
@@ -515,7 +587,17 @@ class MonitoringAPI:
     def run(self, host: str = "0.0.0.0", port: int = 8000):
         """启动监控服务"""
         logger.info(f"🚀 启动监控API服务: http://{host}:{port}")
-        uvicorn.run(self.app, host=host, port=port)
+        # loop/http 为 auto 时优先选用 uvloop/httptools；
+        # 指标保存在进程内存中，多 worker 时各进程数据不一致，因此保持单 worker
+        uvicorn.run(
+            self.app,
+            host=host,
+            port=port,
+            loop="auto",
+            http="auto",
+            log_level="warning",
+            access_log=False
+        )
 
 
 # 全局监控API实例
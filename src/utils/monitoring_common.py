@@ -0,0 +1,70 @@
+"""
+监控面板公共组件
+指标环形缓冲区和 orjson 响应工具，供 monitoring 和 enhanced_monitoring 共用
+"""
+
+from typing import Any, Tuple
+import numpy as np
+import orjson
+from fastapi.responses import Response
+
+# orjson 序列化选项：直接序列化 numpy 数组（无需 tolist()），允许非字符串键
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def json_dumps(payload: Any) -> bytes:
+    """使用 orjson 序列化为 JSON 字节串（datetime 直接输出为 ISO 字符串）"""
+    return orjson.dumps(payload, option=_ORJSON_OPTS, default=str)
+
+
+def json_response(payload: Any) -> Response:
+    """构建 orjson 序列化的 JSON 响应"""
+    return Response(json_dumps(payload), media_type="application/json")
+
+
+class RingBuffer:
+    """定长时间序列环形缓冲区（时间戳与数值分别存储在连续的 float64 数组中）"""
+    
+    __slots__ = ("ts", "val", "head", "count", "cap")
+    
+    def __init__(self, cap: int):
+        self.ts = np.zeros(cap, dtype=np.float64)
+        self.val = np.zeros(cap, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.cap = cap
+    
+    def push(self, t: float, v: float):
+        """追加一个数据点，写满后覆盖最旧的数据"""
+        head = self.head
+        self.ts[head] = t
+        self.val[head] = v
+        self.head = (head + 1) % self.cap
+        if self.count < self.cap:
+            self.count += 1
+    
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间先后顺序返回 (ts, val) 数组"""
+        if self.count < self.cap:
+            return self.ts[:self.count], self.val[:self.count]
+        return np.roll(self.ts, -self.head), np.roll(self.val, -self.head)
+    
+    def since(self, cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间先后返回时间戳不早于 cutoff 的 (ts, val) 数组"""
+        # 写满后 head 之后的部分更旧；两段各自有序，分别二分查找起点
+        if self.count < self.cap:
+            segments = ((0, self.count),)
+        else:
+            segments = ((self.head, self.cap), (0, self.head))
+        
+        ts_parts = []
+        val_parts = []
+        for lo, hi in segments:
+            start = lo + int(np.searchsorted(self.ts[lo:hi], cutoff))
+            ts_parts.append(self.ts[start:hi])
+            val_parts.append(self.val[start:hi])
+        
+        return np.concatenate(ts_parts), np.concatenate(val_parts)
+    
+    def __len__(self) -> int:
+        return self.count
@@ -5,26 +5,122 @@
 
 import asyncio
 import logging
+import math
 import queue
 import time
+import warnings
+import numpy as np
+import xxhash
 from typing import Optional, Callable, Dict, Any
 from collections import deque
 from coze_coding_dev_sdk import ASRClient
 from coze_coding_utils.runtime_ctx.context import new_context
 import base64
 
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
 logger = logging.getLogger(__name__)
 
 
+class AudioRingBuffer:
+    """
+    音频环形字节缓冲区
+    
+    容量为2的幂，下标用位与取模；写入和消费只移动下标，不搬移已有数据。
+    写入超出容量时按2倍扩容。
+    """
+    
+    __slots__ = ("_buf", "_view", "_mask", "_head", "_count")
+    
+    def __init__(self, capacity: int):
+        """
+        参数:
+            capacity: 初始容量（字节），向上取整为2的幂
+        """
+        capacity = 1 << max(capacity - 1, 1).bit_length()
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._mask = capacity - 1
+        self._head = 0
+        self._count = 0
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def write(self, data: bytes):
+        """追加数据，回绕时分两段写入"""
+        size = len(data)
+        if self._count + size > len(self._buf):
+            self._grow(self._count + size)
+        
+        capacity = len(self._buf)
+        tail = (self._head + self._count) & self._mask
+        first = min(size, capacity - tail)
+        
+        data = memoryview(data)
+        self._view[tail:tail + first] = data[:first]
+        if first < size:
+            self._view[:size - first] = data[first:]
+        
+        self._count += size
+    
+    def peek(self, size: int) -> bytes:
+        """读取开头的 size 字节（不消费），回绕时拼接两段"""
+        head = self._head
+        end = head + size
+        if end <= len(self._buf):
+            return bytes(self._view[head:end])
+        return b"".join((self._view[head:], self._view[:end & self._mask]))
+    
+    def peek_samples(self, size: int) -> np.ndarray:
+        """
+        以int16数组读取开头的 size 字节（不消费）
+        
+        不回绕时直接引用缓冲区内存，不复制；返回的数组只能在下一次写入前使用
+        """
+        head = self._head
+        end = head + size
+        if end <= len(self._buf):
+            return np.frombuffer(self._buf, dtype=np.int16, count=size // 2, offset=head)
+        return np.concatenate((
+            np.frombuffer(self._buf, dtype=np.uint8, offset=head),
+            np.frombuffer(self._buf, dtype=np.uint8, count=end & self._mask)
+        ))[:size // 2 * 2].view(np.int16)
+    
+    def consume(self, size: int):
+        """丢弃开头的 size 字节"""
+        self._head = (self._head + size) & self._mask
+        self._count -= size
+    
+    def _grow(self, needed: int):
+        """扩容并把现有数据移动到新缓冲区开头"""
+        data = self.peek(self._count)
+        capacity = 1 << (needed - 1).bit_length()
+        
+        # 旧缓冲区可能仍被 peek_samples 返回的数组引用，直接替换而不释放
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._view[:len(data)] = data
+        self._mask = capacity - 1
+        self._head = 0
+
+
 class StreamingASR:
     """流式ASR识别器"""
     
+    # 待处理音频上限（片段数）；ASR处理不过来时丢弃最旧的音频，避免积压导致延迟和内存无限增长
+    MAX_BACKLOG_CHUNKS = 4
+    
     def __init__(
         self,
         chunk_duration: float = 2.0,
         overlap: float = 0.5,
         sample_rate: int = 16000,
-        on_result_callback: Optional[Callable] = None
+        on_result_callback: Optional[Callable] = None,
+        silence_threshold: float = 100.0
     ):
         """
         参数:
@@ -32,26 +128,53 @@ class StreamingASR:
             overlap: 重叠时长（秒），用于提高连续性
             sample_rate: 采样率
             on_result_callback: 结果回调函数
+            silence_threshold: 静音阈值（int16采样的RMS），低于该值的片段不送ASR；0表示不过滤
         """
         self.chunk_duration = chunk_duration
         self.overlap = overlap
         self.sample_rate = sample_rate
         self.on_result_callback = on_result_callback
+        self.silence_threshold = silence_threshold
+        
+        self.chunk_size = int(chunk_duration * sample_rate * 2)  # 16-bit = 2 bytes
+        self.overlap_size = int(overlap * sample_rate * 2)
         
         self.asr_client = ASRClient(ctx=new_context(method="streaming_asr"))
-        self.audio_queue = asyncio.Queue()
+        
+        # 单生产者单消费者：生产者直接写入预分配的环形缓冲区并置位事件，
+        # 处理循环被唤醒后按片段读取，不再经过队列逐块传递
+        self._max_buffered = self.MAX_BACKLOG_CHUNKS * self.chunk_size
+        self._audio_buffer = AudioRingBuffer(self._max_buffered)
+        self._audio_ready = asyncio.Event()
+        
         self.is_running = False
         self.last_result = ""
         self.total_processed = 0
+        self.silent_skipped = 0
+        self.duplicate_skipped = 0
+        self.dropped_bytes = 0
+        self._last_chunk_hash: Optional[int] = None
     
     async def add_audio_chunk(self, audio_data: bytes):
         """
-        添加音频数据到队列
+        添加音频数据到缓冲区
         
         参数:
             audio_data: PCM格式音频数据（16-bit, mono）
         """
-        await self.audio_queue.put(audio_data)
+        buffer = self._audio_buffer
+        
+        # 积压超过上限时丢弃最旧的音频（按整样本对齐），保证识别的是最新音频
+        excess = len(buffer) + len(audio_data) - self._max_buffered
+        if excess > 0:
+            excess = min(excess + (excess & 1), len(buffer))
+            buffer.consume(excess)
+            self.dropped_bytes += excess
+            logger.warning(f"⚠️ 音频积压已满，丢弃最旧的 {excess} bytes (累计{self.dropped_bytes} bytes)")
+        
+        buffer.write(audio_data)
+        self._audio_ready.set()
+        
         logger.debug(f"添加音频片段: {len(audio_data)} bytes")
     
     async def start(self):
@@ -66,31 +189,36 @@ class StreamingASR:
     
     async def _process_audio_loop(self):
         """处理音频循环"""
-        buffer = deque()
-        chunk_size = int(self.chunk_duration * self.sample_rate * 2)  # 16-bit = 2 bytes
-        overlap_size = int(self.overlap * self.sample_rate * 2)
+        chunk_size = self.chunk_size
+        overlap_size = self.overlap_size
+        buffer = self._audio_buffer
         
         logger.info(f"音频片段大小: {chunk_size} bytes, 重叠: {overlap_size} bytes")
         
         while self.is_running:
             try:
-                # 获取音频数据
-                audio_data = await asyncio.wait_for(
-                    self.audio_queue.get(),
-                    timeout=1.0
-                )
-                
-                # 添加到缓冲区
-                buffer.extend(audio_data)
+                # 等待新音频写入；被唤醒时缓冲区中已包含此前写入的全部数据
+                await asyncio.wait_for(self._audio_ready.wait(), timeout=1.0)
+                self._audio_ready.clear()
                 
                 # 当缓冲区足够大时，进行处理
                 while len(buffer) >= chunk_size:
+                    # 静音片段跳过，不发起ASR请求；直接在缓冲区上判断，无需复制出字节
+                    if self._is_silent(buffer.peek_samples(chunk_size)):
+                        buffer.consume(chunk_size - overlap_size)
+                        self.silent_skipped += 1
+                        continue
+                    
                     # 提取片段
-                    chunk = list(buffer)[:chunk_size]
-                    del buffer[:chunk_size - overlap_size]  # 保留重叠部分
+                    chunk_bytes = buffer.peek(chunk_size)
+                    buffer.consume(chunk_size - overlap_size)  # 保留重叠部分
                     
-                    # 转换为字节数组
-                    chunk_bytes = bytes(chunk)
+                    # 非重叠部分与上一片段完全相同时，识别结果不会变化，跳过ASR请求
+                    chunk_hash = xxhash.xxh3_64_intdigest(memoryview(chunk_bytes)[overlap_size:])
+                    if chunk_hash == self._last_chunk_hash and self.last_result:
+                        self.duplicate_skipped += 1
+                        continue
+                    self._last_chunk_hash = chunk_hash
                     
                     # 识别语音
                     await self._recognize_chunk(chunk_bytes)
@@ -102,18 +230,24 @@ class StreamingASR:
                 logger.error(f"❌ 处理音频失败: {str(e)}")
                 await asyncio.sleep(0.1)
     
+    def _is_silent(self, samples: np.ndarray) -> bool:
+        """按片段int16采样的RMS能量判断是否静音"""
+        if self.silence_threshold <= 0:
+            return False
+        
+        samples = samples.astype(np.float32)
+        if samples.size == 0:
+            return True
+        
+        rms = math.sqrt(float(np.dot(samples, samples)) / samples.size)
+        return rms < self.silence_threshold
+    
     async def _recognize_chunk(self, audio_data: bytes):
         """识别单个音频片段"""
         try:
-            # 转换为base64
-            audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            # 调用ASR
+            # 编码和ASR请求都是同步阻塞的，放到线程中执行，期间事件循环继续接收音频
             start_time = time.time()
-            text, data = self.asr_client.recognize(
-                uid="streaming_asr",
-                base64_data=audio_base64
-            )
+            text, data = await asyncio.to_thread(self._recognize_sync, audio_data)
             processing_time = time.time() - start_time
             
             self.total_processed += 1
@@ -126,13 +260,38 @@ class StreamingASR:
                 
                 self.last_result = text
                 
-                # 调用回调函数
-                if self.on_result_callback:
-                    await self.on_result_callback(text, processing_time)
+                await self._emit_result(text, processing_time)
         
         except Exception as e:
             logger.error(f"❌ ASR识别失败: {str(e)}")
     
+    async def _emit_result(self, text: str, processing_time: float):
+        """输出新的识别结果（仅在结果变化时调用一次），子类可重写以调整输出方式"""
+        if self.on_result_callback:
+            await self.on_result_callback(text, processing_time)
+    
+    def _recognize_sync(self, audio_data: bytes):
+        """
+        同步识别：base64编码后调用ASR
+        
+        SDK的ASRClient只提供一次性识别接口（整段base64放在JSON请求体中），
+        没有流式上传或返回部分结果的方式，因此按片段整体编码提交
+        """
+        # SDK要求base64_data为str（放进JSON请求体）。
+        # 重叠部分无法复用上一片段的编码结果：base64按3字节分组，
+        # 默认重叠长度（16000字节）不是3的倍数，拼接结果与整体编码不一致
+        if pybase64 is not None:
+            # SIMD实现，直接输出str，省去中间bytes对象
+            audio_base64 = pybase64.b64encode_as_string(audio_data)
+        else:
+            # b64encode直接接受bytes/memoryview，输出只含ASCII字符
+            audio_base64 = base64.b64encode(audio_data).decode('ascii')
+        
+        return self.asr_client.recognize(
+            uid="streaming_asr",
+            base64_data=audio_base64
+        )
+    
     async def stop(self):
         """停止识别"""
         self.is_running = False
@@ -142,7 +301,10 @@ class StreamingASR:
         """获取统计信息"""
         return {
             "total_processed": self.total_processed,
-            "queue_size": self.audio_queue.qsize(),
+            "silent_skipped": self.silent_skipped,
+            "duplicate_skipped": self.duplicate_skipped,
+            "dropped_bytes": self.dropped_bytes,
+            "buffered_bytes": len(self._audio_buffer),
             "last_result": self.last_result,
             "is_running": self.is_running
         }
@@ -156,42 +318,31 @@ class SlidingWindowASR(StreamingASR):
         chunk_duration: float = 2.0,
         overlap: float = 0.5,
         sample_rate: int = 16000,
-        window_size: int = 3,  # 窗口大小（片段数）
-        on_result_callback: Optional[Callable] = None
+        window_size: Optional[int] = None,
+        on_result_callback: Optional[Callable] = None,
+        silence_threshold: float = 100.0
     ):
-        super().__init__(chunk_duration, overlap, sample_rate, on_result_callback)
-        self.window_size = window_size
-        self.results_window = deque(maxlen=window_size)
+        """
+        参数:
+            window_size: 已废弃，不再生效（结果不再按窗口融合）；仅为兼容位置参数保留
+            其余参数同 StreamingASR
+        """
+        if window_size is not None:
+            warnings.warn(
+                "SlidingWindowASR 的 window_size 参数已废弃且不再生效",
+                DeprecationWarning,
+                stacklevel=2
+            )
+        
+        super().__init__(
+            chunk_duration, overlap, sample_rate, on_result_callback, silence_threshold
+        )
     
-    async def _recognize_chunk(self, audio_data: bytes):
-        """识别音频片段并应用滑动窗口"""
-        try:
-            # 调用父类方法进行识别
-            await super()._recognize_chunk(audio_data)
-            
-            # 添加结果到窗口
-            if self.last_result:
-                self.results_window.append(self.last_result)
-            
-            # 如果窗口已满，进行文本融合
-            if len(self.results_window) >= self.window_size:
-                fused_text = self._fuse_results(list(self.results_window))
-                
-                logger.info(f"🔗 融合结果: {fused_text}")
-                
-                # 调用回调函数
-                if self.on_result_callback:
-                    await self.on_result_callback(fused_text, 0)
-        except Exception as e:
-            logger.error(f"❌ 流式识别失败: {str(e)}")
-            if self.on_error_callback:
-                await self.on_error_callback(e)
-    
-    def _fuse_results(self, results: list) -> str:
-        """融合多个识别结果"""
-        # 简单的融合策略：取最新结果
-        # 可以改进为：去重、合并相似内容等
-        return results[-1]
+    async def _emit_result(self, text: str, processing_time: float):
+        """输出融合结果（融合结果即最新结果，父类已保证只在结果变化时触发）"""
+        logger.info(f"🔗 融合结果: {text}")
+        
+        await super()._emit_result(text, processing_time)
 
 
 class RealtimeAnchorMonitor:
@@ -211,6 +362,10 @@ class RealtimeAnchorMonitor:
         self.verify_callback = verify_callback
         self.recent_speeches = deque(maxlen=10)
         self.start_time = time.time()
+        
+        # recent_speeches 中各项耗时的累计值，随窗口进出增量维护
+        self._sum_processing_time = 0.0
+        self._sum_total_latency = 0.0
     
     async def on_speech_result(self, text: str, processing_time: float):
         """
@@ -228,7 +383,15 @@ class RealtimeAnchorMonitor:
             "total_latency": time.time() - self.start_time
         }
         
+        # 窗口已满时最旧的一项会被挤出，先从累计值中扣除
+        if len(self.recent_speeches) == self.recent_speeches.maxlen:
+            oldest = self.recent_speeches[0]
+            self._sum_processing_time -= oldest['processing_time']
+            self._sum_total_latency -= oldest['total_latency']
+        
         self.recent_speeches.append(speech_entry)
+        self._sum_processing_time += processing_time
+        self._sum_total_latency += speech_entry['total_latency']
         
         logger.info(
             f"🎙️ 主播语音: {text} "
@@ -256,15 +419,12 @@ class RealtimeAnchorMonitor:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
+        count = len(self.recent_speeches)
         return {
             "asr_stats": self.asr.get_stats(),
-            "recent_speeches_count": len(self.recent_speeches),
-            "avg_processing_time": sum(
-                s['processing_time'] for s in self.recent_speeches
-            ) / len(self.recent_speeches) if self.recent_speeches else 0,
-            "avg_total_latency": sum(
-                s['total_latency'] for s in self.recent_speeches
-            ) / len(self.recent_speeches) if self.recent_speeches else 0
+            "recent_speeches_count": count,
+            "avg_processing_time": self._sum_processing_time / count if count else 0,
+            "avg_total_latency": self._sum_total_latency / count if count else 0
         }
 
 
@@ -281,14 +441,15 @@ async def test_streaming_asr():
     # 模拟音频流（生成测试音频）
     def simulate_audio_stream():
         """模拟音频流"""
+        # 生成2秒的测试音频（16kHz, 16-bit, mono）
+        # 2秒恰好是440Hz的整数个周期，各片段首尾相接，只需生成一次
+        duration = 2.0
+        sample_rate = 16000
+        t = np.linspace(0, duration, int(sample_rate * duration), False)
+        audio = (np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+        audio_bytes = audio.tobytes()
+        
         while True:
-            # 生成2秒的测试音频（16kHz, 16-bit, mono）
-            duration = 2.0
-            sample_rate = 16000
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-            audio = (np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
-            audio_bytes = audio.tobytes()
-            
             yield audio_bytes
             time.sleep(2.0)
     
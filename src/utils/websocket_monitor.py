@@ -5,6 +5,7 @@ WebSocket重连监控
 
 import asyncio
 import logging
+import random
 import time
 import os
 from enum import Enum
@@ -12,13 +13,32 @@ from typing import Optional, Callable, Dict, Any
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
 import websockets
-import json
+import orjson
 
 from .error_handler import handle_error_async, ErrorCategory
 
 logger = logging.getLogger(__name__)
 
 
+def _env_int(name: str) -> Optional[int]:
+    """读取整数环境变量，未设置时返回None"""
+    value = os.getenv(name)
+    return int(value) if value is not None else None
+
+
+# 环境变量在导入时读取一次，设置后覆盖构造参数
+_ENV_MAX_RETRIES = _env_int("WEBSOCKET_MAX_RETRIES")
+_ENV_RETRY_DELAY = _env_int("WEBSOCKET_RETRY_DELAY")
+_ENV_HEARTBEAT_INTERVAL = _env_int("WEBSOCKET_HEARTBEAT_INTERVAL")
+
+
+def _encode_message(message: Any) -> Any:
+    """字典消息用 orjson 序列化为JSON文本，其它消息原样返回"""
+    if isinstance(message, dict):
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return message
+
+
 class ConnectionState(Enum):
     """连接状态"""
     DISCONNECTED = "disconnected"
@@ -30,11 +50,11 @@ class ConnectionState(Enum):
 
 @dataclass
 class ConnectionMetrics:
-    """连接指标"""
-    connected_at: Optional[datetime] = None
-    disconnected_at: Optional[datetime] = None
-    last_ping: Optional[datetime] = None
-    last_pong: Optional[datetime] = None
+    """连接指标（时间点均为 time.monotonic() 读数）"""
+    connected_at: Optional[float] = None
+    disconnected_at: Optional[float] = None
+    last_pong: Optional[float] = None
+    connected_at_wall: Optional[datetime] = None  # 连接时的墙上时间，仅用于展示
     reconnect_count: int = 0
     messages_received: int = 0
     messages_sent: int = 0
@@ -44,14 +64,14 @@ class ConnectionMetrics:
     def get_uptime(self) -> float:
         """获取连接时长（秒）"""
         if self.connected_at and self.last_pong:
-            return (self.last_pong - self.connected_at).total_seconds()
+            return self.last_pong - self.connected_at
         return 0
     
-    def get_avg_latency(self) -> float:
-        """获取平均延迟（秒）"""
-        if self.last_ping and self.last_pong:
-            return (self.last_pong - self.last_ping).total_seconds()
-        return 0
+    def to_wall_time(self, timestamp: Optional[float]) -> Optional[datetime]:
+        """将单调时钟读数换算为墙上时间（以连接时刻为基准）"""
+        if timestamp is None or self.connected_at is None or self.connected_at_wall is None:
+            return None
+        return self.connected_at_wall + timedelta(seconds=timestamp - self.connected_at)
 
 
 class WebSocketMonitor:
@@ -76,9 +96,11 @@ class WebSocketMonitor:
             on_state_change_callback: 状态变化回调
         """
         self.url = url
-        self.max_retries = int(os.getenv("WEBSOCKET_MAX_RETRIES", max_retries))
-        self.retry_delay = int(os.getenv("WEBSOCKET_RETRY_DELAY", retry_delay))
-        self.heartbeat_interval = int(os.getenv("WEBSOCKET_HEARTBEAT_INTERVAL", heartbeat_interval))
+        self.max_retries = _ENV_MAX_RETRIES if _ENV_MAX_RETRIES is not None else max_retries
+        self.retry_delay = _ENV_RETRY_DELAY if _ENV_RETRY_DELAY is not None else retry_delay
+        self.heartbeat_interval = (
+            _ENV_HEARTBEAT_INTERVAL if _ENV_HEARTBEAT_INTERVAL is not None else heartbeat_interval
+        )
         
         self.on_message = on_message_callback
         self.on_state_change = on_state_change_callback
@@ -88,7 +110,14 @@ class WebSocketMonitor:
         self.websocket = None
         self.is_running = False
         self.reconnect_task = None
-        self.heartbeat_task = None
+        
+        # 上一次重连等待时长，用于去相关抖动退避
+        self._last_delay = self.retry_delay
+        
+        # get_stats 输出的ISO时间字符串缓存，只在对应时间点变化时重新生成
+        self._connected_at_iso: Optional[str] = None
+        self._last_pong_iso: Optional[str] = None
+        self._last_pong_iso_at: Optional[float] = None
         
     async def connect(self):
         """连接到WebSocket服务器"""
@@ -110,14 +139,16 @@ class WebSocketMonitor:
             )
             
             self.state = ConnectionState.CONNECTED
-            self.metrics.connected_at = datetime.now()
+            self.metrics.connected_at = time.monotonic()
+            self.metrics.connected_at_wall = datetime.now()
+            self._connected_at_iso = self.metrics.connected_at_wall.isoformat()
             self.metrics.reconnect_count = 0
+            self._last_delay = self.retry_delay
             self._notify_state_change()
             
             logger.info(f"✅ WebSocket连接成功")
             
-            # 启动心跳任务
-            self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+            # 心跳由 websockets 内置的 ping_interval/ping_timeout 负责，无需单独的心跳任务
             
             # 启动消息接收循环
             await self._message_loop()
@@ -141,8 +172,9 @@ class WebSocketMonitor:
         try:
             async for message in self.websocket:
                 self.metrics.messages_received += 1
-                self.metrics.bytes_received += len(str(message))
-                self.metrics.last_pong = datetime.now()
+                # str按字符数、bytes按字节数计，避免 str(bytes) 生成repr
+                self.metrics.bytes_received += len(message)
+                self.metrics.last_pong = time.monotonic()
                 
                 # 调用消息回调
                 if self.on_message:
@@ -169,28 +201,6 @@ class WebSocketMonitor:
             self.state = ConnectionState.FAILED
             self._notify_state_change()
     
-    async def _heartbeat_loop(self):
-        """心跳循环"""
-        try:
-            while self.state == ConnectionState.CONNECTED:
-                await asyncio.sleep(self.heartbeat_interval)
-                
-                if self.websocket and not self.websocket.closed:
-                    self.metrics.last_ping = datetime.now()
-                    # 发送ping
-                    pong_waiter = await self.websocket.ping()
-                    await pong_waiter
-                    self.metrics.last_pong = datetime.now()
-                    
-                    latency = self.metrics.get_avg_latency()
-                    logger.debug(f"💓 心跳成功, 延迟: {latency:.3f}s")
-                else:
-                    logger.warning("⚠️ WebSocket连接已断开")
-                    break
-        
-        except Exception as e:
-            logger.error(f"❌ 心跳失败: {str(e)}")
-    
     async def reconnect(self):
         """重连"""
         if self.metrics.reconnect_count >= self.max_retries:
@@ -208,11 +218,12 @@ class WebSocketMonitor:
         self.state = ConnectionState.RECONNECTING
         self._notify_state_change()
         
-        # 指数退避
-        delay = self.retry_delay * (2 ** self.metrics.reconnect_count)
+        # 去相关抖动退避：在 [retry_delay, 上次等待×3] 内随机取值，避免多个连接同时重连
+        delay = random.uniform(self.retry_delay, self._last_delay * 3)
         delay = min(delay, 60)  # 最大60秒
+        self._last_delay = delay
         
-        logger.info(f"🔄 {delay}秒后重连... (第{self.metrics.reconnect_count + 1}次)")
+        logger.info(f"🔄 {delay:.1f}秒后重连... (第{self.metrics.reconnect_count + 1}次)")
         
         await asyncio.sleep(delay)
         self.metrics.reconnect_count += 1
@@ -239,14 +250,13 @@ class WebSocketMonitor:
             return False
         
         try:
-            # 如果是字典，转换为JSON字符串
-            if isinstance(message, dict):
-                message = json.dumps(message, ensure_ascii=False)
+            # 如果是字典，转换为JSON字符串（以文本帧发送）
+            message = _encode_message(message)
             
             await self.websocket.send(message)
             
             self.metrics.messages_sent += 1
-            self.metrics.bytes_sent += len(str(message))
+            self.metrics.bytes_sent += len(message)
             
             return True
         
@@ -275,9 +285,6 @@ class WebSocketMonitor:
         self.state = ConnectionState.DISCONNECTED
         self._notify_state_change()
         
-        if self.heartbeat_task:
-            self.heartbeat_task.cancel()
-        
         if self.websocket and not self.websocket.closed:
             await self.websocket.close()
         
@@ -285,18 +292,24 @@ class WebSocketMonitor:
     
     def get_stats(self) -> Dict[str, Any]:
         """获取连接统计"""
+        # last_pong 随消息频繁更新，只在被读取且已变化时才格式化
+        if self.metrics.last_pong != self._last_pong_iso_at:
+            last_pong = self.metrics.to_wall_time(self.metrics.last_pong)
+            self._last_pong_iso = last_pong.isoformat() if last_pong else None
+            self._last_pong_iso_at = self.metrics.last_pong
+        
         return {
             "state": self.state.value,
             "url": self.url,
             "uptime": self.metrics.get_uptime(),
-            "latency": self.metrics.get_avg_latency(),
+            "latency": self.websocket.latency if self.websocket is not None else 0,
             "reconnect_count": self.metrics.reconnect_count,
             "messages_received": self.metrics.messages_received,
             "messages_sent": self.metrics.messages_sent,
             "bytes_received": self.metrics.bytes_received,
             "bytes_sent": self.metrics.bytes_sent,
-            "connected_at": self.metrics.connected_at.isoformat() if self.metrics.connected_at else None,
-            "last_pong": self.metrics.last_pong.isoformat() if self.metrics.last_pong else None
+            "connected_at": self._connected_at_iso,
+            "last_pong": self._last_pong_iso
         }
     
     def is_connected(self) -> bool:
@@ -376,11 +389,15 @@ class WebSocketPool:
     
     async def broadcast(self, message: Any):
         """广播消息到所有连接"""
-        success_count = 0
+        # 只序列化一次，各连接发送同一份文本
+        message = _encode_message(message)
         
-        for name, monitor in self.connections.items():
-            if await monitor.send(message):
-                success_count += 1
+        # 各连接并发发送，总耗时取决于最慢的连接
+        results = await asyncio.gather(
+            *(monitor.send(message) for monitor in self.connections.values()),
+            return_exceptions=True
+        )
+        success_count = sum(1 for result in results if result is True)
         
         logger.info(f"📤 广播消息到 {success_count}/{len(self.connections)} 个连接")
         